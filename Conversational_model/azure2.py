@@ -1,9 +1,11 @@
-import openai
+import httpx
 import azure.cognitiveservices.speech as speechsdk
 import time
 
+from chat_api import OPENAI_CHAT_URL, chat, openai_headers
+
 # OpenAI API Key Configuration (hardcoded for testing)
-openai.api_key = "#lbk#AA"
+OPENAI_API_KEY = "#lbk#AA"
 
 # Azure Speech SDK Configuration for STT and TTS (hardcoded for testing)
 speech_key = "#"
@@ -19,16 +21,20 @@ speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, au
 
 def get_ai_response(prompt):
     try:
-        response = openai.ChatCompletion.create(
+        response = chat(
+            OPENAI_CHAT_URL, openai_headers(OPENAI_API_KEY),
+            [{"role": "user", "content": prompt}],
             model="gpt-4o-mini",  # Ensure this is the correct model name
-            messages=[{"role": "user", "content": prompt}],
             max_tokens=100,
             temperature=0.5
         )
-        return response.choices[0].message['content'].strip() if response.choices else "I didn't catch that. Could you repeat?"
-    except openai.error.AuthenticationError as e:
-        print("Authentication Error:", e)
-        return "I'm having trouble authenticating with the OpenAI service."
+        return response.strip() if response else "I didn't catch that. Could you repeat?"
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 401:
+            print("Authentication Error:", e)
+            return "I'm having trouble authenticating with the OpenAI service."
+        print("An error occurred:", e)
+        return "I'm having trouble processing your request right now."
     except Exception as e:
         print("An error occurred:", e)
         return "I'm having trouble processing your request right now."
@@ -1,9 +1,15 @@
 from flask import Flask, request, jsonify, send_file
 from flask_socketio import SocketIO, emit
-import requests
+import httpx
 import azure.cognitiveservices.speech as speechsdk
 from io import BytesIO
 import os
+import re
+
+from chat_api import azure_chat_url, azure_headers, chat
+from session_memory import SessionMemory, summary_prompt
+from speech_pipeline import make_pipeline
+from shared.audio_cache import MEDIA_TYPES, AudioCache, audio_key
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
@@ -18,22 +24,28 @@ SPEECH_REGION = '#'
 speech_config = speechsdk.SpeechConfig(subscription=SPEECH_KEY, region=SPEECH_REGION)
 speech_config.speech_synthesis_voice_name = 'en-US-JennyNeural'  # Choose appropriate voice
 
-# In-memory conversation history per session
-conversation_histories = {}
+CHAT_COMPLETIONS_URL = azure_chat_url(OPENAI_ENDPOINT, "gpt-4-32k")
+# SPEECH_PIPELINE=1 streams the reply and sends audio sentence by sentence;
+# SPEECH_BACKEND / LLM_BACKEND=fake swap in local stand-ins (see speech_pipeline.py)
+SPEECH_PIPELINE = os.getenv("SPEECH_PIPELINE", "1") == "1"
+# Synthesized audio on disk (TTS_CACHE_DIR, at most TTS_CACHE_MAX_MB); repeated text plays from it
+audio_cache = AudioCache()
+pipeline = make_pipeline(speech_config, CHAT_COMPLETIONS_URL, OPENAI_API_KEY, audio_cache=audio_cache)
+AUDIO_KEY = re.compile(r"^[0-9a-f]{64}$")
 
 
 @socketio.on('connect')
 def handle_connect():
     print('Client connected')
     # Initialize conversation history for this session
-    conversation_histories[request.sid] = []
+    memory.start(request.sid)
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     print('Client disconnected')
     # Remove conversation history for this session
-    conversation_histories.pop(request.sid, None)
+    memory.end(request.sid)
 
 
 @socketio.on('user_audio')
@@ -46,42 +58,57 @@ def handle_user_audio(data):
             return
 
         # Update conversation history
-        conversation_histories[request.sid].append({"role": "user", "content": user_text})
+        memory.append(request.sid, "user", user_text)
 
-        # Get AI response
-        ai_text = get_ai_response(user_text, conversation_histories[request.sid])
+        if SPEECH_PIPELINE:
+            ai_text = stream_ai_audio(request.sid)
+        else:
+            # Get AI response from the summary and recent turns
+            ai_text = get_ai_response(user_text, memory.messages(request.sid))
 
-        # Update conversation history
-        conversation_histories[request.sid].append({"role": "assistant", "content": ai_text})
+            # Convert AI text to speech
+            ai_audio = text_to_speech(ai_text)
+            if not ai_audio:
+                emit('error', {'message': 'Could not synthesize speech.'})
+                return
 
-        # Convert AI text to speech
-        ai_audio = text_to_speech(ai_text)
-        if not ai_audio:
-            emit('error', {'message': 'Could not synthesize speech.'})
-            return
+            # Send AI audio back to frontend
+            emit('ai_audio', {'audio': ai_audio})
+
+        # Update conversation history
+        memory.append(request.sid, "assistant", ai_text)
 
-        # Send AI audio back to frontend
-        emit('ai_audio', {'audio': ai_audio})
+        # Fold old turns into the summary once the user has the reply
+        memory.compact(request.sid)
 
     except Exception as e:
         print(f"WebSocket Error: {e}")
         emit('error', {'message': 'Internal server error.'})
 
 
+def stream_ai_audio(sid):
+    # Each sentence is sent as 'ai_audio_chunk' as soon as it is synthesized, while the
+    # rest of the reply is still being generated; 'ai_audio_end' closes the reply
+    def send_chunk(index, sentence, audio):
+        socketio.emit('ai_audio_chunk', {'index': index, 'text': sentence, 'audio': audio}, to=sid)
+
+    try:
+        ai_text = pipeline.respond(memory.messages(sid), send_chunk)
+    except Exception as e:
+        print(f"AI Response Error: {e}")
+        ai_text = ""
+    if not ai_text:
+        ai_text = "I'm sorry, I encountered an error."
+        ai_audio = text_to_speech(ai_text)
+        if ai_audio:
+            send_chunk(0, ai_text, ai_audio)
+    socketio.emit('ai_audio_end', {'text': ai_text}, to=sid)
+    return ai_text
+
+
 def speech_to_text(audio_data, session_id):
     try:
-        audio_stream = BytesIO(audio_data)
-        audio_input = speechsdk.AudioConfig(stream=speechsdk.AudioInputStream(
-            stream_format=speechsdk.AudioStreamFormat(encoding=speechsdk.AudioStreamEncodingFormat.Pcm,
-                                                      samples_per_second=16000, bits_per_sample=16, channels=1),
-            audio_stream=audio_stream))
-        speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_input)
-        result = speech_recognizer.recognize_once()
-        if result.reason == speechsdk.ResultReason.RecognizedSpeech:
-            return result.text
-        else:
-            print(f"STT Error for session {session_id}: {result.reason}")
-            return ""
+        return pipeline.transcribe(audio_data)
     except Exception as e:
         print(f"STT Exception for session {session_id}: {e}")
         return ""
@@ -89,42 +116,61 @@ def speech_to_text(audio_data, session_id):
 
 def get_ai_response(prompt, conversation_history):
     try:
-        headers = {
-            'Content-Type': 'application/json',
-            'api-key': OPENAI_API_KEY
-        }
-        payload = {
-            "messages": conversation_history,
-            "max_tokens": 150,
-            "temperature": 0.7
-        }
-        response = requests.post(
-            f"{OPENAI_ENDPOINT}/openai/deployments/gpt-4-32k/chat/completions?api-version=2024-08-01-preview",
-            headers=headers, json=payload
-        )
-        if response.status_code == 200:
-            return response.json()['choices'][0]['message']['content']
-        else:
-            print(f"OpenAI API Error: {response.status_code}, {response.text}")
-            return "I'm sorry, I couldn't process that."
+        # Pooled connection with timeouts; 429/5xx are retried with jittered backoff
+        return chat(CHAT_COMPLETIONS_URL, azure_headers(OPENAI_API_KEY), conversation_history,
+                    max_tokens=150, temperature=0.7)
+    except httpx.HTTPStatusError as e:
+        print(f"OpenAI API Error: {e.response.status_code}, {e.response.text}")
+        return "I'm sorry, I couldn't process that."
     except Exception as e:
         print(f"AI Response Error: {e}")
         return "I'm sorry, I encountered an error."
 
 
+def summarize_conversation(summary, messages):
+    return chat(CHAT_COMPLETIONS_URL, azure_headers(OPENAI_API_KEY), summary_prompt(summary, messages),
+                max_tokens=250, temperature=0.2).strip()
+
+
+# Conversation per session: recent turns within a token budget plus a running summary.
+# Set SESSION_STORE_URL=redis://... to share sessions between worker processes.
+memory = SessionMemory(summarize=summarize_conversation)
+
+
 def text_to_speech(text):
     try:
-        synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
-        result = synthesizer.speak_text_async(text).get()
-        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-            return result.audio_data
-        else:
-            print(f"TTS Error: {result.reason}")
-            return None
+        # Reuses this thread's synthesizer instead of creating one per reply
+        return pipeline.synthesize(text)
     except Exception as e:
         print(f"TTS Exception: {e}")
         return None
 
 
+@app.route('/tts', methods=['POST'])
+def narrate():
+    # Synthesizes a text once; later requests for the same text cost no synthesis call
+    text = ((request.get_json(silent=True) or {}).get('text') or '').strip()
+    if not text:
+        return jsonify({'error': 'No text provided.'}), 400
+    if not text_to_speech(text):
+        return jsonify({'error': 'Could not synthesize speech.'}), 502
+    fmt = pipeline.tts.format
+    key = audio_key(text, pipeline.tts.voice, fmt)
+    return jsonify({'key': key, 'url': f'/audio/{key}.{fmt}'})
+
+
+@app.route('/audio/<key>.<fmt>')
+def cached_audio(key, fmt):
+    # Content-addressed, so browsers may keep the audio forever
+    if not AUDIO_KEY.match(key) or fmt not in MEDIA_TYPES:
+        return jsonify({'error': 'Audio not found.'}), 404
+    if key in request.if_none_match:
+        return '', 304
+    audio = audio_cache.read(key, fmt)
+    if audio is None:
+        return jsonify({'error': 'Audio not found.'}), 404
+    return send_file(BytesIO(audio), mimetype=MEDIA_TYPES[fmt], etag=key, max_age=365 * 24 * 3600)
+
+
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
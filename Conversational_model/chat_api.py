@@ -0,0 +1,38 @@
+# Chat completion calls for the voice service, over the shared pooled client in shared/llm_client.py
+import os
+import sys
+
+# shared/ lives at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.llm_client import get_client, sse_data  # noqa: E402
+
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
+
+def azure_chat_url(endpoint, deployment, api_version="2024-08-01-preview"):
+    return f"{endpoint}/openai/deployments/{deployment}/chat/completions?api-version={api_version}"
+
+
+def azure_headers(api_key):
+    return {'Content-Type': 'application/json', 'api-key': api_key}
+
+
+def openai_headers(api_key):
+    return {'Content-Type': 'application/json', 'Authorization': f'Bearer {api_key}'}
+
+
+def chat(url, headers, messages, **params):
+    # Reply text; raises httpx.HTTPStatusError once retries are exhausted
+    data = get_client().post_json(url, {"messages": messages, **params}, headers)
+    return data['choices'][0]['message']['content']
+
+
+def chat_stream(url, headers, messages, **params):
+    # Reply text deltas as the model produces them
+    lines = get_client().stream_lines(url, {"messages": messages, **params, "stream": True}, headers)
+    for data in sse_data(lines):
+        choices = data.get("choices") or []
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
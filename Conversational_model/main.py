@@ -1,13 +1,16 @@
-import openai
 import pyaudio
 import speech_recognition as sr
 from gtts import gTTS
 from playsound import playsound
-import os
+from io import BytesIO
 import threading
 
+from chat_api import OPENAI_CHAT_URL, chat, openai_headers
+from session_memory import SessionMemory, summary_prompt
+from shared.audio_cache import AudioCache, audio_key
+
 # Set up OpenAI API key and model
-openai.api_key = '###'
+OPENAI_API_KEY = '###'
 
 MODEL_NAME = "gpt-4-turbo"
 
@@ -23,39 +26,49 @@ initial_context = {
     """
 }
 
-# Conversation history for chat context
-conversation_history = [initial_context]
+SESSION_ID = "local"
+TTS_VOICE = "gtts:en"
+
+# Spoken replies on disk, so repeated replies are played without calling gTTS again
+audio_cache = AudioCache()
+
+
+def summarize_conversation(summary, messages):
+    return chat(OPENAI_CHAT_URL, openai_headers(OPENAI_API_KEY), summary_prompt(summary, messages),
+                model=MODEL_NAME, max_tokens=250).strip()
+
+
+# Conversation history for chat context: recent turns within a token budget plus a running summary
+memory = SessionMemory(summarize=summarize_conversation)
 
 
 # Function to get response from OpenAI with conversation history
 def get_response(user_text):
-    global conversation_history
-
     # Append the user's message to the conversation history
-    conversation_history.append({"role": "user", "content": user_text})
-
-    # Call OpenAI's Chat API with conversation history
-    response = openai.ChatCompletion.create(
-        model=MODEL_NAME,
-        messages=conversation_history,
-        max_tokens=100
-    )
+    memory.append(SESSION_ID, "user", user_text)
 
-    # Extract the AI's response
-    ai_response = response['choices'][0]['message']['content'].strip()
+    # Call OpenAI's Chat API with the context, the summary and the recent turns
+    # (pooled connection, retried on 429/5xx)
+    ai_response = chat(OPENAI_CHAT_URL, openai_headers(OPENAI_API_KEY),
+                       memory.messages(SESSION_ID, system=initial_context),
+                       model=MODEL_NAME, max_tokens=100).strip()
 
     # Append the AI's response to conversation history for continuity
-    conversation_history.append({"role": "assistant", "content": ai_response})
+    memory.append(SESSION_ID, "assistant", ai_response)
 
     return ai_response
 
 
+def synthesize_mp3(text):
+    audio = BytesIO()
+    gTTS(text=text, lang='en').write_to_fp(audio)
+    return audio.getvalue()
+
+
 # Function to convert text to speech and play it
 def speak_text(text):
-    tts = gTTS(text=text, lang='en')
-    tts.save("response.mp3")
-    playsound("response.mp3")
-    os.remove("response.mp3")
+    if audio_cache.get_or_synthesize(text, TTS_VOICE, "mp3", synthesize_mp3):
+        playsound(audio_cache.path(audio_key(text, TTS_VOICE, "mp3"), "mp3"))
 
 
 # Initialize speech recognizer
@@ -86,6 +99,9 @@ def listen_and_respond():
                 # Speak AI's response in a separate thread to avoid blocking
                 threading.Thread(target=speak_text, args=(ai_response,)).start()
 
+                # Fold old turns into the summary while the response plays
+                memory.compact(SESSION_ID)
+
             except sr.UnknownValueError:
                 print("Could not understand audio, please speak again.")
             except sr.RequestError as e:
@@ -0,0 +1,232 @@
+# Bounded conversation memory: recent turns within a token budget, older turns folded into a summary
+#
+# State lives in a pluggable store. The default keeps sessions in this process; set
+# SESSION_STORE_URL=redis://host:6379/0 to share sessions between Socket.IO worker processes.
+import json
+import os
+import threading
+import time
+
+# Tokens of conversation (summary + recent turns) sent with each request
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))
+# Recent messages kept verbatim; older ones are folded into the summary
+MEMORY_WINDOW_MESSAGES = int(os.getenv("MEMORY_WINDOW_MESSAGES", "12"))
+SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+# Sessions untouched for this long are dropped
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "")
+# How often the in-process store sweeps idle sessions
+EVICT_INTERVAL = 60.0
+CHARS_PER_TOKEN = 4
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text):
+    if _encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def message_tokens(message):
+    # Content plus the few tokens of per-message framing the chat API adds
+    return count_tokens(message["content"]) + 4
+
+
+def clip_to_tokens(text, max_tokens):
+    # Keep the most recent part of a text
+    if count_tokens(text) <= max_tokens:
+        return text
+    return "..." + text[-max_tokens * CHARS_PER_TOKEN:]
+
+
+class InProcessStore:
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def get(self, session_id):
+        with self._lock:
+            state = self._sessions.get(session_id)
+            return json.loads(state) if state is not None else None
+
+    def put(self, session_id, state):
+        self.update(session_id, lambda _: state)
+
+    def update(self, session_id, change):
+        # Atomic read-modify-write: `change(state or None)` returns the new state, or None to leave it
+        with self._lock:
+            state = self._sessions.get(session_id)
+            state = change(json.loads(state) if state is not None else None)
+            if state is not None:
+                self._sessions[session_id] = json.dumps(state)
+        if time.monotonic() - self._last_sweep >= EVICT_INTERVAL:
+            self.evict_idle(SESSION_IDLE_SECONDS)
+        return state
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict_idle(self, max_idle):
+        cutoff = time.time() - max_idle
+        with self._lock:
+            self._last_sweep = time.monotonic()
+            idle = [sid for sid, state in self._sessions.items() if json.loads(state)["updated"] < cutoff]
+            for session_id in idle:
+                del self._sessions[session_id]
+        return len(idle)
+
+
+class RedisStore:
+    def __init__(self, url, prefix="session:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._watch_error = redis.WatchError
+
+    def get(self, session_id):
+        state = self.client.get(self.prefix + session_id)
+        return json.loads(state) if state is not None else None
+
+    def put(self, session_id, state):
+        # Redis expires idle sessions itself
+        self.client.set(self.prefix + session_id, json.dumps(state), ex=int(SESSION_IDLE_SECONDS))
+
+    def update(self, session_id, change):
+        # WATCH/MULTI: retried if another worker writes the session between our read and write
+        key = self.prefix + session_id
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    state = pipe.get(key)
+                    state = change(json.loads(state) if state is not None else None)
+                    if state is None:
+                        pipe.unwatch()
+                        return None
+                    pipe.multi()
+                    pipe.set(key, json.dumps(state), ex=int(SESSION_IDLE_SECONDS))
+                    pipe.execute()
+                    return state
+                except self._watch_error:
+                    continue
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+    def evict_idle(self, max_idle):
+        return 0
+
+
+def make_store(url=SESSION_STORE_URL):
+    if url.startswith(("redis://", "rediss://")):
+        return RedisStore(url)
+    return InProcessStore()
+
+
+class SessionMemory:
+    """Per-session chat history for the LLM: a running summary plus the recent turns.
+
+    `summarize(summary, messages)` returns the summary updated with the given messages;
+    without it, old turns are simply dropped.
+    """
+
+    def __init__(self, store=None, summarize=None, token_budget=MEMORY_TOKEN_BUDGET,
+                 window_messages=MEMORY_WINDOW_MESSAGES, summary_max_tokens=SUMMARY_MAX_TOKENS):
+        self.store = store or make_store()
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.window_messages = window_messages
+        self.summary_max_tokens = summary_max_tokens
+
+    def _load(self, session_id):
+        return self.store.get(session_id) or {"summary": "", "messages": [], "updated": time.time()}
+
+    def _update(self, session_id, change):
+        # Apply `change` to the stored state (a fresh one if none) and save it, atomically
+        def apply(state):
+            state = state or {"summary": "", "messages": [], "updated": time.time()}
+            change(state)
+            state["updated"] = time.time()
+            return state
+        return self.store.update(session_id, apply)
+
+    def start(self, session_id):
+        self._update(session_id, lambda state: None)
+
+    def end(self, session_id):
+        self.store.delete(session_id)
+
+    def append(self, session_id, role, content):
+        self._update(session_id, lambda state: state["messages"].append({"role": role, "content": content}))
+
+    def _overflow(self, state, fraction=1.0):
+        # Number of oldest messages that do not fit `fraction` of the window and token budget
+        messages = state["messages"]
+        budget = self.token_budget - (count_tokens(state["summary"]) if state["summary"] else 0)
+        budget *= fraction
+        keep, used = 0, 0
+        for message in reversed(messages[-max(1, int(self.window_messages * fraction)):]):
+            used += message_tokens(message)
+            if used > budget and keep:
+                break
+            keep += 1
+        return len(messages) - keep
+
+    def compact(self, session_id):
+        """Fold the turns that fell out of the window into the summary.
+
+        Makes an LLM call when there is something to fold, so call it after replying. Turns
+        appended meanwhile are kept: only the folded prefix is removed from the stored state.
+        """
+        state = self.store.get(session_id)
+        if state is None or self._overflow(state) == 0:
+            return
+        # Fold down to half the window so the next summary call is several turns away
+        overflow = self._overflow(state, fraction=0.5)
+        old, summary = state["messages"][:overflow], state["summary"]
+        if self.summarize is not None:
+            try:
+                summary = clip_to_tokens(self.summarize(summary, old), self.summary_max_tokens)
+            except Exception as e:
+                print(f"Conversation summary failed for session {session_id}: {e}")
+
+        def fold(current):
+            # Compare-and-set: skip if the session ended or another compaction folded it first
+            if current is None or current["summary"] != state["summary"] or current["messages"][:overflow] != old:
+                return None
+            current["messages"] = current["messages"][overflow:]
+            current["summary"] = summary
+            current["updated"] = time.time()
+            return current
+        self.store.update(session_id, fold)
+
+    def messages(self, session_id, system=None):
+        # Chat messages for the next request; never over budget even if compact() has not run yet
+        state = self._load(session_id)
+        state["messages"] = state["messages"][self._overflow(state):]
+        messages = [system] if system else []
+        if state["summary"]:
+            messages.append({"role": "system",
+                             "content": f"Summary of the earlier conversation: {state['summary']}"})
+        return messages + state["messages"]
+
+    def evict_idle(self):
+        return self.store.evict_idle(SESSION_IDLE_SECONDS)
+
+
+def summary_prompt(summary, messages):
+    # Messages asking a chat model to fold `messages` into the running `summary`
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    return [
+        {"role": "system", "content": "You maintain a short running summary of a tutoring conversation. "
+                                      "Keep names, facts, decisions and open questions; drop small talk."},
+        {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}\n\n"
+                                    "Reply with the updated summary only, in under 150 words."},
+    ]
@@ -0,0 +1,196 @@
+# Streaming voice replies: the LLM streams its answer, every finished sentence is synthesized
+# on a pool of reused synthesizers and sent while later sentences are still being generated
+#
+# Backends are chosen with SPEECH_BACKEND / LLM_BACKEND: "azure" (default) or "fake" for
+# local runs without credentials (fake STT treats the audio bytes as UTF-8 text).
+# Synthesized audio goes through the shared disk cache, so repeated text is never re-synthesized.
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chat_api import azure_headers, chat_stream
+from shared.audio_cache import wav_bytes
+
+SPEECH_BACKEND = os.getenv("SPEECH_BACKEND", "azure")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "azure")
+# Sentences synthesized at once per process
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+# Shorter fragments wait for the next sentence, so the voice does not stutter
+MIN_SENTENCE_CHARS = int(os.getenv("MIN_SENTENCE_CHARS", "20"))
+FAKE_LLM_TOKEN_LATENCY = float(os.getenv("FAKE_LLM_TOKEN_LATENCY", "0.02"))
+FAKE_TTS_LATENCY = float(os.getenv("FAKE_TTS_LATENCY", "0.05"))
+
+SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def split_sentences(deltas, min_chars=MIN_SENTENCE_CHARS):
+    # Text deltas -> complete sentences as soon as they end, then whatever is left
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        parts = SENTENCE_END.split(buffer)
+        buffer = parts.pop()
+        pending = ""
+        for part in parts:
+            pending = f"{pending} {part}" if pending else part
+            if len(pending) >= min_chars:
+                yield pending
+                pending = ""
+        if pending:
+            buffer = f"{pending} {buffer}"
+    if buffer.strip():
+        yield buffer.strip()
+
+
+class AzureSTT:
+    def __init__(self, speech_config):
+        import azure.cognitiveservices.speech as speechsdk
+        self.speechsdk = speechsdk
+        self.speech_config = speech_config
+        self.stream_format = speechsdk.audio.AudioStreamFormat(samples_per_second=16000, bits_per_sample=16,
+                                                               channels=1)
+
+    def transcribe(self, audio):
+        # A recognizer is bound to its input stream, so only the config and format are shared
+        speechsdk = self.speechsdk
+        stream = speechsdk.audio.PushAudioInputStream(stream_format=self.stream_format)
+        stream.write(audio)
+        stream.close()
+        recognizer = speechsdk.SpeechRecognizer(speech_config=self.speech_config,
+                                                audio_config=speechsdk.audio.AudioConfig(stream=stream))
+        result = recognizer.recognize_once()
+        if result.reason == speechsdk.ResultReason.RecognizedSpeech:
+            return result.text
+        print(f"STT Error: {result.reason}")
+        return ""
+
+
+class AzureTTS:
+    # The SDK's default output is RIFF PCM
+    format = "wav"
+
+    def __init__(self, speech_config):
+        import azure.cognitiveservices.speech as speechsdk
+        self.speechsdk = speechsdk
+        self.speech_config = speech_config
+        self.voice = f"azure:{speech_config.speech_synthesis_voice_name}"
+        # One synthesizer per TTS thread, kept for the life of the process
+        self._local = threading.local()
+
+    def synthesize(self, text):
+        synthesizer = getattr(self._local, "synthesizer", None)
+        if synthesizer is None:
+            synthesizer = self.speechsdk.SpeechSynthesizer(speech_config=self.speech_config, audio_config=None)
+            self._local.synthesizer = synthesizer
+        result = synthesizer.speak_text_async(text).get()
+        if result.reason == self.speechsdk.ResultReason.SynthesizingAudioCompleted:
+            return result.audio_data
+        print(f"TTS Error: {result.reason}")
+        return None
+
+
+class AzureChatLLM:
+    def __init__(self, url, api_key, max_tokens=150, temperature=0.7):
+        self.url = url
+        self.headers = azure_headers(api_key)
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    def stream(self, messages):
+        # Over the shared pooled client; retried until the first delta arrives
+        return chat_stream(self.url, self.headers, messages, max_tokens=self.max_tokens,
+                           temperature=self.temperature)
+
+
+class FakeSTT:
+    def transcribe(self, audio):
+        return audio.decode("utf-8", errors="ignore").strip()
+
+
+class FakeTTS:
+    voice = "fake"
+    format = "wav"
+
+    def __init__(self, latency=FAKE_TTS_LATENCY):
+        self.latency = latency
+
+    def synthesize(self, text):
+        time.sleep(self.latency)
+        # 10 ms of silence per character
+        return wav_bytes(b"\0\0" * 160 * len(text))
+
+
+class FakeChatLLM:
+    def __init__(self, token_latency=FAKE_LLM_TOKEN_LATENCY):
+        self.token_latency = token_latency
+
+    def stream(self, messages):
+        question = messages[-1]["content"] if messages else ""
+        reply = (f"You asked about {question.rstrip('?.!')}. That is a good question. "
+                 "Here is a short explanation in a few sentences. Let me know if you want more detail.")
+        for word in reply.split(" "):
+            time.sleep(self.token_latency)
+            yield word + " "
+
+
+class SpeechPipeline:
+    def __init__(self, stt, tts, llm, tts_workers=TTS_WORKERS, audio_cache=None):
+        self.stt = stt
+        self.tts = tts
+        self.llm = llm
+        self.audio_cache = audio_cache
+        self.executor = ThreadPoolExecutor(max_workers=tts_workers, thread_name_prefix="tts")
+
+    def transcribe(self, audio):
+        return self.stt.transcribe(audio)
+
+    def synthesize(self, text):
+        if self.audio_cache is None:
+            return self.tts.synthesize(text)
+        return self.audio_cache.get_or_synthesize(text, self.tts.voice, self.tts.format, self.tts.synthesize)
+
+    def respond(self, messages, on_audio):
+        """Stream the reply to `messages`, calling on_audio(index, sentence, audio) in order as
+        each sentence is synthesized. Returns the full reply text."""
+        started = time.perf_counter()
+        first_audio = []
+        futures = queue.Queue()
+
+        def send_in_order():
+            # Sentences are synthesized in parallel but sent in the order they were spoken
+            for index, sentence, future in iter(futures.get, None):
+                try:
+                    audio = future.result()
+                except Exception as e:
+                    print(f"TTS Exception: {e}")
+                    audio = None
+                if audio:
+                    if not first_audio:
+                        first_audio.append(time.perf_counter() - started)
+                    on_audio(index, sentence, audio)
+
+        sender = threading.Thread(target=send_in_order, daemon=True)
+        sender.start()
+        sentences = []
+        try:
+            for sentence in split_sentences(self.llm.stream(messages)):
+                futures.put((len(sentences), sentence, self.executor.submit(self.synthesize, sentence)))
+                sentences.append(sentence)
+        finally:
+            futures.put(None)
+            sender.join()
+        if first_audio:
+            print(f"Time to first audio: {first_audio[0]:.2f}s ({len(sentences)} sentences)")
+        return " ".join(sentences)
+
+
+def make_pipeline(speech_config=None, chat_url=None, api_key=None, audio_cache=None):
+    if SPEECH_BACKEND == "fake":
+        stt, tts = FakeSTT(), FakeTTS()
+    else:
+        stt, tts = AzureSTT(speech_config), AzureTTS(speech_config)
+    llm = FakeChatLLM() if LLM_BACKEND == "fake" else AzureChatLLM(chat_url, api_key)
+    return SpeechPipeline(stt, tts, llm, audio_cache=audio_cache)
@@ -0,0 +1,127 @@
+# Answer cache for /query: exact match on the normalized question, then near-duplicate embeddings
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL = 24 * 3600
+# Cosine similarity above which two questions are treated as the same question
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+
+def normalize_query(query: str) -> str:
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+class AnswerCache:
+    """Bounded (LRU + TTL) cache of query responses, partitioned by retrieval scope."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL,
+                 similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        # (scope, normalized query) -> (stored_at, unit embedding or None, response, latency)
+        self._entries: "OrderedDict[Tuple[tuple, str], tuple]" = OrderedDict()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        # Manifest generation the entries were answered against
+        self._generation = None
+
+    def _expired(self, stored_at: float) -> bool:
+        return time.monotonic() - stored_at > self.ttl
+
+    def get_exact(self, scope: tuple, query: str) -> Optional[dict]:
+        key = (scope, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0]):
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            self.latency_saved += entry[3]
+            return entry[2]
+
+    def get_similar(self, scope: tuple, embedding: List[float]) -> Optional[dict]:
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for key, (stored_at, vector, _, _) in self._entries.items():
+                if key[0] != scope or vector is None or self._expired(stored_at):
+                    continue
+                score = float(vector @ query)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            self.semantic_hits += 1
+            self.latency_saved += entry[3]
+            return entry[2]
+
+    def put(self, scope: tuple, query: str, response: dict, embedding: Optional[List[float]] = None,
+            latency: float = 0.0):
+        vector = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            key = (scope, normalize_query(query))
+            self._entries[key] = (time.monotonic(), vector, response, latency)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, directory: Optional[str] = None, filename: Optional[str] = None):
+        # Drop every entry whose scope could include the new documents: the unscoped
+        # cache, the course itself, and any document scope within the course
+        with self._lock:
+            for key in list(self._entries):
+                scope_directory, scope_filename = key[0]
+                if ((scope_directory is None or scope_directory == directory)
+                        and (scope_filename is None or scope_filename == filename)):
+                    del self._entries[key]
+
+    def sync(self, generation: int) -> bool:
+        """Clear the cache if the ingest manifest changed since the last call; returns True if cleared."""
+        with self._lock:
+            if generation == self._generation:
+                return False
+            self._generation = generation
+            self._entries.clear()
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            memory = sum(
+                sys.getsizeof(entry[2].get("answer", "")) + sys.getsizeof(entry[2].get("context", ""))
+                + (entry[1].nbytes if entry[1] is not None else 0)
+                for entry in self._entries.values()
+            )
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "approx_memory_bytes": memory,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+            }
@@ -0,0 +1,260 @@
+# End-to-end API benchmark, fully offline: fake LLM/embeddings/OCR, local vector store,
+# synthetic PDFs, requests driven through the ASGI app in-process
+#
+#   cd backend && python benchmarks/bench_api.py
+#   cd backend && python benchmarks/bench_api.py --concurrency 16 --requests 400 --llm-latency 0.2
+#   cd backend && python benchmarks/bench_api.py --save-baseline     # after an intentional change
+#   cd backend && python benchmarks/bench_api.py --check             # exit 1 on regression
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmarks", "baselines", "api.json")
+ENDPOINTS = ("upload", "query", "query_batch", "qa", "mcq", "summary")
+# Questions per /query/batch request (a review sheet)
+BATCH_QUESTIONS = 20
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux; pdf extraction children are reported separately
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return round(self_rss, 1), round(children_rss, 1)
+
+
+def summarize(latencies, statuses, wall):
+    ok = [latency for latency, status in zip(latencies, statuses) if status < 400]
+    self_rss, children_rss = peak_rss_mb()
+    return {
+        "requests": len(latencies),
+        "errors": sum(1 for status in statuses if status >= 400),
+        "status": dict(Counter(str(status) for status in statuses)),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(ok, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ok, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ok, 0.99) * 1000, 2),
+        "peak_rss_mb": self_rss,
+        "peak_child_rss_mb": children_rss,
+    }
+
+
+async def drive(client, make_request, total, concurrency, bodies=None):
+    # `concurrency` closed-loop clients issue `total` requests between them;
+    # response bodies are collected into `bodies` when given
+    latencies, statuses = [], []
+    remaining = iter(range(total))
+
+    async def worker():
+        for i in remaining:
+            method, url, kwargs = make_request(i)
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            await response.aread()
+            if bodies is not None:
+                bodies.append(response.json())
+            latencies.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+async def run(args, pdfs):
+    import httpx
+    import main as app_module
+    from synthetic_pdfs import VOCABULARY
+
+    rng = random.Random(args.seed)
+    queries = [" ".join(rng.sample(VOCABULARY, 3)) for _ in range(args.unique_queries)]
+    results = {}
+
+    async with app_module.app.router.lifespan_context(app_module.app):
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            if "upload" in args.endpoints:
+                def upload(i):
+                    name, data = pdfs[i]
+                    return "POST", "/upload", {"params": {"directory": "bench"},
+                                               "files": {"file": (name, data, "application/pdf")}}
+                jobs = []
+                results["upload"] = await drive(client, upload, len(pdfs), args.concurrency, bodies=jobs)
+
+                # Uploads only queue the work: time until every ingest job has finished
+                start = time.perf_counter()
+                pending = {job["job_id"] for job in jobs if "job_id" in job}
+                failed = 0
+                while pending:
+                    for job_id in list(pending):
+                        job = (await client.get(f"/jobs/{job_id}")).json()
+                        if job["status"] in ("done", "failed"):
+                            pending.discard(job_id)
+                            failed += job["status"] == "failed"
+                    await asyncio.sleep(0.05)
+                results["upload"]["jobs_done_s"] = round(time.perf_counter() - start, 2)
+                results["upload"]["jobs_failed"] = failed
+
+                # Let the background summaries finish so /summary measures the stored path
+                deadline = time.monotonic() + args.summary_timeout
+                start = time.perf_counter()
+                pending = {name for name, _ in pdfs}
+                while pending and time.monotonic() < deadline:
+                    for name in list(pending):
+                        response = await client.get("/summary", params={"directory": "bench", "filename": name})
+                        if response.status_code != 202:
+                            pending.discard(name)
+                    await asyncio.sleep(0.05)
+                results["upload"]["summaries_ready_s"] = round(time.perf_counter() - start, 2)
+
+            def scoped(i):
+                # Alternate between unscoped, course-scoped and document-scoped requests
+                params = {"query": queries[i % len(queries)]}
+                if i % 3 == 1:
+                    params["directory"] = "bench"
+                elif i % 3 == 2:
+                    params["directory"] = "bench"
+                    params["filename"] = pdfs[i % len(pdfs)][0]
+                return params
+
+            requests = {
+                "query": lambda i: ("POST", "/query", {"params": scoped(i)}),
+                "qa": lambda i: ("POST", "/qa", {"params": scoped(i)}),
+                "mcq": lambda i: ("POST", "/mcq", {"params": {**scoped(i), "num_questions": 3,
+                                                              "session_id": f"s{i % 16}"}}),
+                "summary": lambda i: ("GET", "/summary", {"params": {"directory": "bench",
+                                                                     "filename": pdfs[i % len(pdfs)][0]}}),
+            }
+            for endpoint, make_request in requests.items():
+                if endpoint in args.endpoints:
+                    results[endpoint] = await drive(client, make_request, args.requests, args.concurrency)
+
+            if "query_batch" in args.endpoints:
+                # As many questions as the /query run, asked BATCH_QUESTIONS at a time
+                def batch(i):
+                    params = scoped(i)
+                    params["queries"] = [queries[(i * BATCH_QUESTIONS + j) % len(queries)]
+                                         for j in range(BATCH_QUESTIONS)]
+                    del params["query"]
+                    return "POST", "/query/batch", {"json": params}
+                results["query_batch"] = await drive(client, batch, max(1, args.requests // BATCH_QUESTIONS),
+                                                     args.concurrency)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for endpoint, current in results.items():
+        previous = baseline.get("results", {}).get(endpoint)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{endpoint}: errors {previous['errors']} -> {current['errors']}")
+        if previous.get("jobs_done_s") and current.get("jobs_done_s", 0) > previous["jobs_done_s"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: ingest jobs {previous['jobs_done_s']}s -> {current['jobs_done_s']}s")
+        if current.get("jobs_failed", 0) > previous.get("jobs_failed", 0):
+            regressions.append(f"{endpoint}: failed jobs {previous.get('jobs_failed', 0)} -> {current['jobs_failed']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end API benchmark")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--text-pdfs", type=int, default=4)
+    parser.add_argument("--image-pdfs", type=int, default=1)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per non-upload endpoint")
+    parser.add_argument("--unique-queries", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--ocr-latency", type=float, default=0.02)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--summary-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit 1 if worse than the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    args.endpoints = [endpoint for endpoint in args.endpoints.split(",") if endpoint]
+
+    # Providers and stores are chosen at import time, so configure them before importing main
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "EMBEDDING_PROVIDER": "fake",
+        "OCR_PROVIDER": "fake",
+        "VECTOR_BACKEND": "local",
+        "FAKE_LLM_LATENCY": str(args.llm_latency),
+        "FAKE_EMBEDDING_LATENCY": str(args.embedding_latency),
+        "FAKE_OCR_LATENCY": str(args.ocr_latency),
+        "EMBEDDING_DIMENSION": str(args.dimension),
+        "WARMUP": "0",
+        "TOKEN_ENCODING": "none",
+    })
+    sys.path[:0] = [BACKEND_DIR, os.path.join(BACKEND_DIR, "benchmarks")]
+    from synthetic_pdfs import synthetic_pdf
+
+    pdfs = [(f"text-{i}.pdf", synthetic_pdf(i, args.pages, seed=args.seed)) for i in range(args.text_pdfs)]
+    pdfs += [(f"scan-{i}.pdf", synthetic_pdf(args.text_pdfs + i, args.pages, image_every=1, seed=args.seed))
+             for i in range(args.image_pdfs)]
+
+    config = {key: value for key, value in vars(args).items()
+              if key not in ("output", "baseline", "save_baseline", "check", "tolerance")}
+    with tempfile.TemporaryDirectory() as workdir:
+        # main.py keeps uploads, texts, caches and the index relative to the working directory
+        os.chdir(workdir)
+        results = asyncio.run(run(args, pdfs))
+        os.chdir(BACKEND_DIR)
+
+    report = {"config": config, "python": platform.python_version(), "cpus": os.cpu_count(), "results": results}
+    print(f"{'endpoint':<12}{'reqs':>6}{'err':>5}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rss MB':>9}")
+    for endpoint, result in results.items():
+        print(f"{endpoint:<12}{result['requests']:>6}{result['errors']:>5}{result['throughput_rps']:>9}"
+              f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}{result['peak_rss_mb']:>9}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("Note: baseline was recorded with a different configuration")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions and args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Cold-start cost of the API: `import main`, and uvicorn launch until /readyz answers 200
+#
+#   cd backend && python benchmarks/bench_startup.py --runs 5
+#   cd backend && WARMUP=1 python benchmarks/bench_startup.py --query "What is an eigenvalue?"
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_import(runs: int):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], cwd=BACKEND_DIR, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def wait_until_ready(url: str, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/readyz") as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def time_server(port: int, timeout: float, query: str = None):
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        if not wait_until_ready(url, timeout):
+            raise RuntimeError(f"/readyz did not return 200 within {timeout}s")
+        ready = time.perf_counter() - start
+        first_query = None
+        if query:
+            request = urllib.request.Request(f"{url}/query?{urllib.parse.urlencode({'query': query})}", method="POST")
+            query_start = time.perf_counter()
+            urllib.request.urlopen(request).read()
+            first_query = time.perf_counter() - query_start
+        return ready, first_query
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API cold start")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--query", help="also time the first /query after the server is ready")
+    args = parser.parse_args()
+
+    imports = time_import(args.runs)
+    print(f"import main: median {statistics.median(imports):.2f}s  min {min(imports):.2f}s  ({args.runs} runs)")
+
+    for run in range(args.runs):
+        ready, first_query = time_server(args.port, args.timeout, args.query)
+        line = f"run {run + 1}: start -> ready {ready:.2f}s"
+        if first_query is not None:
+            line += f"  first /query {first_query:.2f}s"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
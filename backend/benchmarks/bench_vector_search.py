@@ -0,0 +1,48 @@
+# Top-k latency of LocalVectorStore (flat and IVF) on random unit vectors
+#
+#   cd backend && python benchmarks/bench_vector_search.py --rows 50000 --dim 1536
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from local_vector_store import LocalVectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local vector search")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.rows, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    texts = [f"chunk {i}" for i in range(args.rows)]
+
+    for mode in ("flat", "ivf"):
+        with tempfile.TemporaryDirectory() as directory:
+            store = LocalVectorStore(embedding=None, directory=directory, mode=mode)
+            start = time.perf_counter()
+            store.add_embeddings(texts, vectors)
+            build = time.perf_counter() - start
+
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                store.similarity_search_with_score_by_vector(query, k=args.k)
+                latencies.append(time.perf_counter() - start)
+            latencies = np.array(latencies) * 1000
+            print(f"{mode:<5} build {build:6.2f} s  p50 {np.percentile(latencies, 50):7.3f} ms  "
+                  f"p95 {np.percentile(latencies, 95):7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Deterministic synthetic PDFs for benchmarks: text pages, image-only (scanned) pages, or a mix
+#
+#   cd backend && python benchmarks/synthetic_pdfs.py out_dir --count 3 --pages 40 --image-every 5
+import argparse
+import os
+import random
+import zlib
+from typing import List
+
+VOCABULARY = (
+    "matrix vector eigenvalue eigenvector determinant linear transformation basis span rank "
+    "kernel subspace orthogonal projection inner product norm gradient derivative integral limit "
+    "series convergence probability distribution variance expectation hypothesis sample population "
+    "society culture institution norm role status group network theory method evidence analysis "
+    "experiment observation model prediction error algorithm complexity graph tree sorting search"
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+LINES_PER_PAGE = 46
+WORDS_PER_LINE = 12
+IMAGE_SIZE = 256
+
+
+def page_lines(rng: random.Random, document: int, page: int) -> List[str]:
+    lines = [f"Document {document} page {page + 1}"]
+    for _ in range(LINES_PER_PAGE - 1):
+        words = [rng.choice(VOCABULARY) for _ in range(WORDS_PER_LINE)]
+        lines.append(" ".join(words).capitalize() + ".")
+    return lines
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _text_stream(lines: List[str]) -> bytes:
+    body = "\n".join(f"({_escape(line)}) '" for line in lines)
+    return f"BT /F1 10 Tf 14 TL 50 {PAGE_HEIGHT - 50} Td\n{body}\nET".encode("latin-1")
+
+
+def _image_stream(rng: random.Random) -> bytes:
+    # Grayscale noise: no text layer, so extraction sends the page to OCR
+    pixels = bytes(rng.randrange(256) for _ in range(IMAGE_SIZE * IMAGE_SIZE))
+    return zlib.compress(pixels)
+
+
+def build_pdf(pages: List[dict]) -> bytes:
+    """pages: [{"lines": [...]}] for text pages, [{"image": bytes}] for image-only pages."""
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")
+    pages_id = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for page in pages:
+        if "image" in page:
+            image = add(
+                f"<< /Type /XObject /Subtype /Image /Width {IMAGE_SIZE} /Height {IMAGE_SIZE} "
+                f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode "
+                f"/Length {len(page['image'])} >>\nstream\n".encode() + page["image"] + b"\nendstream"
+            )
+            content = b"q 512 0 0 512 50 140 cm /Im1 Do Q"
+            resources = f"<< /XObject << /Im1 {image} 0 R >> >>"
+        else:
+            content = _text_stream(page["lines"])
+            resources = f"<< /Font << /F1 {font} 0 R >> >>"
+        stream = add(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources {resources} /Contents {stream} 0 R >>".encode()
+        ))
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode()
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def synthetic_pdf(document: int, num_pages: int, image_every: int = 0, seed: int = 0) -> bytes:
+    """image_every=0: text only; 1: image-only; n: every n-th page is a scan."""
+    rng = random.Random(seed * 100003 + document)
+    pages = []
+    for page in range(num_pages):
+        if image_every and page % image_every == image_every - 1:
+            pages.append({"image": _image_stream(rng)})
+        else:
+            pages.append({"lines": page_lines(rng, document, page)})
+    return build_pdf(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic benchmark PDFs")
+    parser.add_argument("out_dir")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--image-every", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for document in range(args.count):
+        path = os.path.join(args.out_dir, f"synthetic-{document}.pdf")
+        with open(path, "wb") as f:
+            f.write(synthetic_pdf(document, args.pages, args.image_every, args.seed))
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
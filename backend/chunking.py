@@ -0,0 +1,173 @@
+# Token-sized chunking across page boundaries, with boilerplate and near-duplicate removal
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+import metrics
+from tokens import token_counts
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+# A line is boilerplate (header, footer, slide template) when it appears on this share of pages
+BOILERPLATE_MIN_FRACTION = float(os.getenv("BOILERPLATE_MIN_FRACTION", "0.3"))
+BOILERPLATE_MIN_PAGES = 3
+# Longer lines are body text even if they repeat (e.g. a definition restated on every slide)
+BOILERPLATE_MAX_WORDS = 12
+# Word-shingle Jaccard similarity above which a chunk is dropped as a near duplicate
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+SHINGLE_WORDS = 5
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+DIGITS = re.compile(r"\d+")
+WORDS = re.compile(r"\w+")
+_MERSENNE = (1 << 61) - 1
+_rng = np.random.default_rng(0)
+# a, b < 2**32 and 32-bit shingle hashes keep a * x + b within uint64
+_HASH_A = _rng.integers(1, 1 << 32, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_HASH_B = _rng.integers(0, 1 << 32, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def _line_key(line: str) -> str:
+    # "Page 3 of 20" and "Page 4 of 20" are the same footer
+    return DIGITS.sub("#", " ".join(line.lower().split()))
+
+
+def boilerplate_lines(pages: List[str]) -> set:
+    """Normalized lines that repeat on a large share of the pages."""
+    if len(pages) < BOILERPLATE_MIN_PAGES:
+        return set()
+    seen = Counter()
+    for text in pages:
+        seen.update({_line_key(line) for line in text.splitlines()
+                     if line.strip() and len(line.split()) <= BOILERPLATE_MAX_WORDS})
+    threshold = max(BOILERPLATE_MIN_PAGES, BOILERPLATE_MIN_FRACTION * len(pages))
+    return {key for key, pages_with_line in seen.items() if pages_with_line >= threshold}
+
+
+def _segments(text: str, max_tokens: int) -> List[Tuple[str, int]]:
+    # Sentences with their token counts; sentences longer than a chunk are cut on word boundaries
+    sentences = [s for s in SENTENCE_END.split(" ".join(text.split())) if s]
+    segments = []
+    for sentence, tokens in zip(sentences, token_counts(sentences)):
+        if tokens <= max_tokens:
+            segments.append((sentence, tokens))
+            continue
+        words = sentence.split()
+        step = max(1, int(len(words) * max_tokens / tokens))
+        pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        segments.extend(zip(pieces, token_counts(pieces)))
+    return segments
+
+
+def pack_chunks(pages: Iterable[Tuple[int, str]], max_tokens: int = CHUNK_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[Tuple[str, int, int]]:
+    """Greedily fill chunks of up to `max_tokens` from consecutive pages.
+
+    Returns (text, page_start, page_end). Only the tail of the previous chunk is repeated,
+    so overlap is paid per chunk rather than per page.
+    """
+    chunks = []
+    current: List[Tuple[str, int, int]] = []  # (segment, page, tokens)
+    current_tokens = 0
+    # Leading segments of `current` repeated from the previous chunk
+    carried_count = 0
+
+    def emit():
+        chunks.append((" ".join(s for s, _, _ in current), current[0][1], current[-1][1]))
+
+    for page_number, text in pages:
+        for segment, tokens in _segments(text, max_tokens):
+            if current and current_tokens + tokens > max_tokens:
+                emit()
+                # Carry whole trailing segments up to the overlap budget, leaving room for
+                # this segment so the new chunk stays within max_tokens
+                budget = min(overlap_tokens, max_tokens - tokens)
+                carried, carried_tokens = [], 0
+                for entry in reversed(current):
+                    if carried_tokens + entry[2] > budget:
+                        break
+                    carried.insert(0, entry)
+                    carried_tokens += entry[2]
+                current, current_tokens, carried_count = carried, carried_tokens, len(carried)
+            current.append((segment, page_number, tokens))
+            current_tokens += tokens
+    if len(current) > carried_count:
+        emit()
+    return chunks
+
+
+def _shingles(text: str) -> np.ndarray:
+    # 32-bit hashes of every run of SHINGLE_WORDS words, combined from per-word hashes
+    words = np.array([zlib.crc32(word.encode("utf-8")) for word in WORDS.findall(text.lower())],
+                     dtype=np.uint64)
+    if len(words) < SHINGLE_WORDS:
+        words = np.concatenate([words, np.zeros(SHINGLE_WORDS - len(words), dtype=np.uint64)])
+    windows = len(words) - SHINGLE_WORDS + 1
+    hashes = np.zeros(windows, dtype=np.uint64)
+    for offset in range(SHINGLE_WORDS):
+        hashes = (hashes * np.uint64(1000003) + words[offset:offset + windows]) & np.uint64(0xFFFFFFFF)
+    return np.unique(hashes)
+
+
+def _minhash(shingles: np.ndarray) -> np.ndarray:
+    hashed = (np.outer(_HASH_A, shingles) + _HASH_B[:, None]) % _MERSENNE
+    return hashed.min(axis=1)
+
+
+def near_duplicates(texts: List[str], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> set:
+    """Indexes of texts that are near duplicates of an earlier text (MinHash LSH, verified exactly)."""
+    rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    buckets = {}
+    kept_shingles = {}
+    duplicates = set()
+    for i, text in enumerate(texts):
+        shingles = _shingles(text)
+        signature = _minhash(shingles)
+        keys = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(MINHASH_BANDS)]
+        candidates = {j for key in keys for j in buckets.get(key, ())}
+        if any(len(np.intersect1d(shingles, kept_shingles[j], assume_unique=True))
+               / len(np.union1d(shingles, kept_shingles[j])) >= threshold for j in candidates):
+            duplicates.add(i)
+            continue
+        kept_shingles[i] = shingles
+        for key in keys:
+            buckets.setdefault(key, []).append(i)
+    return duplicates
+
+
+def chunk_documents(page_docs: Iterable[Document], max_tokens: int = CHUNK_TOKENS,
+                    overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[Document]:
+    """Page Documents (from extraction.iter_page_documents) -> deduplicated chunk Documents.
+
+    Chunk metadata keeps the page metadata, with `page`/`page_start` set to the first page
+    and `page_end` to the last page the chunk draws from.
+    """
+    page_docs = list(page_docs)
+    if not page_docs:
+        return []
+    metadata = {key: value for key, value in page_docs[0].metadata.items() if key != "page"}
+
+    boilerplate = boilerplate_lines([doc.page_content for doc in page_docs])
+    pages, removed = [], 0
+    for doc in page_docs:
+        lines = doc.page_content.splitlines()
+        kept = [line for line in lines if _line_key(line) not in boilerplate]
+        removed += len(lines) - len(kept)
+        pages.append((doc.metadata["page"], "\n".join(kept)))
+    metrics.count("boilerplate_lines", removed)
+
+    chunks = pack_chunks(pages, max_tokens, overlap_tokens)
+    duplicates = near_duplicates([text for text, _, _ in chunks])
+    metrics.count("duplicate_chunks", len(duplicates))
+    return [
+        Document(page_content=text,
+                 metadata={"page": start, "page_start": start, "page_end": end, **metadata})
+        for i, (text, start, end) in enumerate(chunks) if i not in duplicates
+    ]
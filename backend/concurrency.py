@@ -0,0 +1,65 @@
+# Bounded executors and per-endpoint admission control
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+# Upload pipelines (extraction hand-off, OCR, splitting) running at once per worker
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+
+async def run_blocking(executor: Executor, fn, *args, **kwargs):
+    # Carry contextvars (the request's metrics trace) into the worker thread
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+class EndpointLimiter:
+    """Caps in-flight requests for an endpoint and sheds load with a 503 once its queue is full."""
+
+    def __init__(self, name: str, max_concurrent: int, max_waiting: int, retry_after: int = 1):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.retry_after = retry_after
+        self.waiting = 0
+        self._semaphore = None
+
+    @classmethod
+    def from_env(cls, name: str, max_concurrent: int, max_waiting: int) -> "EndpointLimiter":
+        # e.g. QUERY_CONCURRENCY=16 QUERY_QUEUE=64
+        prefix = name.upper()
+        return cls(
+            name,
+            int(os.getenv(f"{prefix}_CONCURRENCY", str(max_concurrent))),
+            int(os.getenv(f"{prefix}_QUEUE", str(max_waiting))),
+        )
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    async def __aenter__(self):
+        if self.semaphore.locked() and self.waiting >= self.max_waiting:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Server busy ({self.name}), please retry",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
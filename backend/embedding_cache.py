@@ -0,0 +1,294 @@
+# Persistent embedding cache: float32 rows on disk keyed by sha256(model + text)
+#
+# Import the legacy JSON dumps with:
+#   python embedding_cache.py import embeddings/*.json
+import argparse
+import asyncio
+import atexit
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import metrics
+from concurrency import run_blocking
+from tokens import count_tokens_many
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+# OpenAIEmbeddings default; the legacy JSON files were produced with it
+LEGACY_EMBEDDING_MODEL = "text-embedding-ada-002"
+# Texts sent per embedding request on a cache miss
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "512"))
+# Query vectors are buffered and written out once this many are pending
+FLUSH_ROWS = 256
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def count_embedding_tokens(texts: List[str]):
+    # Only cache misses reach (and are billed by) the provider
+    metrics.count("embedding_texts", len(texts))
+    metrics.count("embedding_tokens", count_tokens_many(texts))
+
+
+class EmbeddingStore:
+    """Append-only on-disk vector store shared by the worker processes using the directory.
+
+    Each process appends float32 rows to its own data file and records where they went in
+    index.log (one "key file row" line per vector) under a file lock; other processes pick
+    the new lines up with refresh(). index.json and seg-*.npy from older versions are still read.
+    """
+
+    def __init__(self, directory: str = EMBEDDING_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._lock_path = os.path.join(directory, "index.lock")
+        self._log_path = os.path.join(directory, "index.log")
+        self._log_offset = 0
+        # key -> (data file name, row)
+        self._index: Dict[str, Tuple[str, int]] = {}
+        # Memory maps of data files, re-opened once another writer has appended past them
+        self._maps: Dict[str, np.ndarray] = {}
+        self._pending: Dict[str, np.ndarray] = {}
+        # This process's data file per vector dimension and the rows written to it
+        self._own: Dict[int, Tuple[str, int]] = {}
+        legacy_index = os.path.join(directory, "index.json")
+        if os.path.exists(legacy_index):
+            with open(legacy_index, encoding="utf-8") as f:
+                self._index = {key: (f"seg-{segment:05d}.npy", row) for key, (segment, row) in json.load(f).items()}
+        self.refresh()
+        atexit.register(self.flush)
+
+    def __len__(self) -> int:
+        return len(self._index) + len(self._pending)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index or key in self._pending
+
+    @contextmanager
+    def _file_lock(self):
+        # Serializes writers across uvicorn worker processes sharing the directory
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self):
+        # Read the index lines other processes appended since the last call
+        try:
+            if os.path.getsize(self._log_path) == self._log_offset:
+                return
+        except FileNotFoundError:
+            return
+        # Never waits behind a flush (which reads the log itself) on the event loop
+        if self._lock.acquire(blocking=False):
+            try:
+                self._read_log_locked()
+            finally:
+                self._lock.release()
+
+    def _read_log_locked(self):
+        try:
+            with open(self._log_path, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A line still being written is picked up next time
+        data = data[:data.rfind(b"\n") + 1]
+        for line in data.decode("utf-8").splitlines():
+            key, name, row = line.split(" ")
+            self._index[key] = (name, int(row))
+        self._log_offset += len(data)
+
+    def _rows(self, name: str, row: int) -> np.ndarray:
+        rows = self._maps.get(name)
+        if rows is None or row >= len(rows):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".npy"):
+                rows = np.load(path, mmap_mode="r")
+            else:
+                # vec-<writer>-<dimension>.f32
+                dimension = int(name[:-len(".f32")].rsplit("-", 1)[1])
+                count = os.path.getsize(path) // (4 * dimension)
+                rows = np.memmap(path, dtype=np.float32, mode="r", shape=(count, dimension))
+            self._maps[name] = rows
+        return rows
+
+    def get(self, key: str):
+        vector = self._pending.get(key)
+        if vector is not None:
+            return vector
+        loc = self._index.get(key)
+        if loc is None:
+            return None
+        name, row = loc
+        return self._rows(name, row)[row]
+
+    def put_many(self, items: Dict[str, np.ndarray], flush: bool = True) -> bool:
+        """Buffers `items`, writing them out now if `flush`. Otherwise returns whether enough
+        vectors are pending that the caller should call flush() (off the event loop)."""
+        with self._lock:
+            for key, vector in items.items():
+                if key not in self._index:
+                    self._pending[key] = np.asarray(vector, dtype=np.float32)
+            due = len(self._pending) >= FLUSH_ROWS
+        if flush:
+            self.flush()
+        return due
+
+    def flush(self):
+        # The event loop only ever waits for _lock, which is never held across file I/O
+        with self._flush_lock:
+            with self._lock:
+                pending = dict(self._pending)
+            if not pending:
+                return
+            lines = []
+            for dimension in sorted({len(vector) for vector in pending.values()}):
+                group = [key for key, vector in pending.items() if len(vector) == dimension]
+                name, rows = self._own.get(dimension) or (
+                    f"vec-{os.getpid()}-{uuid.uuid4().hex[:8]}-{dimension}.f32", 0)
+                # Rows are on disk before the index points at them
+                with open(os.path.join(self.directory, name), "ab") as f:
+                    f.write(np.stack([pending[key] for key in group]).tobytes())
+                lines += [(key, name, rows + i) for i, key in enumerate(group)]
+                self._own[dimension] = (name, rows + len(group))
+            with self._file_lock(), self._lock:
+                self._read_log_locked()
+                with open(self._log_path, "a", encoding="utf-8") as f:
+                    f.write("".join(f"{key} {name} {row}\n" for key, name, row in lines))
+                # Our own lines are applied directly
+                self._log_offset = os.path.getsize(self._log_path)
+                for key, name, row in lines:
+                    self._index[key] = (name, row)
+                    self._pending.pop(key, None)
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings provider; only cache misses reach the API, in large batches."""
+
+    def __init__(self, underlying: Embeddings, store: EmbeddingStore = None,
+                 model: str = None, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.underlying = underlying
+        # Not `store or ...`: an empty store is falsy (it has a __len__)
+        self.store = store if store is not None else EmbeddingStore()
+        self.model = model or getattr(underlying, "model", None) or LEGACY_EMBEDDING_MODEL
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, texts: List[str]):
+        self.store.refresh()
+        keys = [cache_key(self.model, text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.store and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        missing_keys = list(missing)
+        batches = [missing_keys[start:start + self.batch_size]
+                   for start in range(0, len(missing_keys), self.batch_size)]
+        return keys, missing, batches
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, missing, batches = self._lookup(texts)
+        for batch in batches:
+            batch_texts = [missing[k] for k in batch]
+            count_embedding_tokens(batch_texts)
+            vectors = self.underlying.embed_documents(batch_texts)
+            self.store.put_many(dict(zip(batch, vectors)), flush=False)
+        self.store.flush()
+        return [self.store.get(key).tolist() for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed(texts, flush=True)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Several queries in one request; buffered like aembed_query instead of written out at once
+        return await self._aembed(texts, flush=False)
+
+    async def _aembed(self, texts: List[str], flush: bool) -> List[List[float]]:
+        # Refreshing the store reads files and token counting is CPU-bound: both run off the loop
+        keys, missing, batches = await run_blocking(None, self._lookup, texts)
+        due = False
+        for batch in batches:
+            batch_texts = [missing[k] for k in batch]
+            await run_blocking(None, count_embedding_tokens, batch_texts)
+            vectors = await self.underlying.aembed_documents(batch_texts)
+            due = self.store.put_many(dict(zip(batch, vectors)), flush=False)
+        if batches and (flush or due):
+            await asyncio.get_running_loop().run_in_executor(None, self.store.flush)
+        return [self.store.get(key).tolist() for key in keys]
+
+    def _cached(self, key: str):
+        # Picks up vectors other workers stored since the last call
+        self.store.refresh()
+        return self.store.get(key)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model, text)
+        vector = self._cached(key)
+        if vector is not None:
+            self.hits += 1
+            return vector.tolist()
+        self.misses += 1
+        count_embedding_tokens([text])
+        vector = self.underlying.embed_query(text)
+        if self.store.put_many({key: vector}, flush=False):
+            self.store.flush()
+        return list(vector)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model, text)
+        vector = await run_blocking(None, self._cached, key)
+        if vector is not None:
+            self.hits += 1
+            return vector.tolist()
+        self.misses += 1
+        await run_blocking(None, count_embedding_tokens, [text])
+        vector = await self.underlying.aembed_query(text)
+        if self.store.put_many({key: vector}, flush=False):
+            await asyncio.get_running_loop().run_in_executor(None, self.store.flush)
+        return list(vector)
+
+    def import_json(self, path: str, model: str = LEGACY_EMBEDDING_MODEL) -> int:
+        # Legacy format: [{"text": ..., "embedding": [...]}, ...]
+        with open(path, encoding="utf-8") as f:
+            records = json.load(f)
+        self.store.put_many({cache_key(model, r["text"]): r["embedding"] for r in records})
+        return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local embedding cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="import legacy {text, embedding} JSON files")
+    import_parser.add_argument("paths", nargs="+")
+    import_parser.add_argument("--model", default=LEGACY_EMBEDDING_MODEL)
+    args = parser.parse_args()
+
+    store = EmbeddingStore()
+    if args.command == "import":
+        cache = CachedEmbeddings(underlying=None, store=store, model=args.model)
+        for path in args.paths:
+            print(f"{path}: imported {cache.import_json(path, args.model)} embeddings")
+        print(f"{len(store)} vectors in {store.directory}")
+
+
+if __name__ == "__main__":
+    main()
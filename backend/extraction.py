@@ -0,0 +1,91 @@
+# Page-parallel PDF text extraction
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from langchain.docstore.document import Document
+
+# Pages handed to a worker per task; large enough to amortise re-opening the PDF
+PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "16"))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Written between pages of the extracted text file: a blank line, then a form feed
+PAGE_BREAK = "\n\n\f"
+
+_executor = None
+# Ingest threads may ask for the pool at the same time; only one may create it
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    return _executor
+
+
+def _warm_worker() -> bool:
+    from PyPDF2 import PdfReader  # noqa: F401
+    return True
+
+
+def warm_up():
+    # Fork the extraction workers and import the PDF stack in each of them
+    executor = get_executor()
+    for future in [executor.submit(_warm_worker) for _ in range(EXTRACT_WORKERS)]:
+        future.result()
+
+
+def count_pages(pdf_path: str) -> int:
+    from PyPDF2 import PdfReader
+    return len(PdfReader(pdf_path).pages)
+
+
+def _extract_range(pdf_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    # Runs in a worker process: every page is parsed exactly once
+    from PyPDF2 import PdfReader
+    reader = PdfReader(pdf_path)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def extract_pages(pdf_path: str, workers: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) for every page in order, including empty pages."""
+    num_pages = count_pages(pdf_path)
+    ranges = [(start, min(start + PAGES_PER_TASK, num_pages))
+              for start in range(0, num_pages, PAGES_PER_TASK)]
+    workers = EXTRACT_WORKERS if workers is None else workers
+
+    if workers <= 1 or len(ranges) <= 1:
+        for start, stop in ranges:
+            yield from _extract_range(pdf_path, start, stop)
+        return
+
+    executor = get_executor() if workers == EXTRACT_WORKERS else ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(_extract_range, pdf_path, start, stop) for start, stop in ranges]
+        for future in futures:
+            yield from future.result()
+    finally:
+        if executor is not _executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_page_documents(pages: Iterable[Tuple[int, str]], metadata: dict,
+                        sink: Optional[TextIO] = None) -> Iterator[Document]:
+    """Turn extracted pages into Documents lazily, skipping empty pages.
+
+    If ``sink`` is given, page texts are also written to it separated by PAGE_BREAK. Empty
+    pages are written too, so the n-th section of the text is page n.
+    """
+    first = True
+    for page_number, text in pages:
+        if sink is not None:
+            if not first:
+                sink.write(PAGE_BREAK)
+            sink.write(text or "")
+        first = False
+        if not text or not text.strip():
+            continue
+        yield Document(page_content=text, metadata={"page": page_number, **metadata})
@@ -0,0 +1,178 @@
+# Content-addressed ingest cache: identical PDFs are extracted and embedded once
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+INGEST_MANIFEST = os.getenv("INGEST_MANIFEST", "ingest_manifest.json")
+
+
+def chunk_ids_for(sha256: str, num_chunks: int) -> List[str]:
+    # Deterministic, so a retried job stores the same chunks instead of new copies
+    return [str(uuid.uuid5(uuid.NAMESPACE_OID, f"{sha256}-{n}")) for n in range(num_chunks)]
+
+
+class HashingWriter:
+    """File wrapper that feeds every written block into a SHA-256 digest."""
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        return self.fileobj.write(data)
+
+
+def save_upload(src: BinaryIO, upload_dir: str) -> Tuple[str, str]:
+    """Store an upload as <sha256>.pdf in `upload_dir`; returns (sha256, path).
+
+    Content-addressed, so uploading a revised file under the same name never changes the
+    bytes a queued job is about to read.
+    """
+    # Hash while copying so the upload is only read once, then move it to its hash's name
+    tmp_path = os.path.join(upload_dir, f".{uuid.uuid4().hex}.upload")
+    try:
+        with open(tmp_path, "wb") as buffer:
+            writer = HashingWriter(buffer)
+            shutil.copyfileobj(src, writer)
+        sha256 = writer.sha256.hexdigest()
+        pdf_path = os.path.join(upload_dir, f"{sha256}.pdf")
+        os.replace(tmp_path, pdf_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return sha256, pdf_path
+
+
+class IngestManifest:
+    """JSON manifest mapping a PDF's SHA-256 to its extracted text, chunk IDs and sources.
+
+    A source is {"directory", "filename", "uploaded_at"}. Uploading different content under a
+    source's name moves the source to the new content; content left without sources is
+    retired: it is kept in the manifest but out of every scope, and re-ingested if uploaded again.
+    """
+
+    def __init__(self, path: str = INGEST_MANIFEST):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._mtime = None
+        # Counts reloads caused by other workers' writes; unlike refresh()'s return value it
+        # does not matter which caller noticed the change
+        self.generation = 0
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Reload the manifest if another worker rewrote it; returns True when it changed."""
+        with self._lock:
+            return self._reload_locked()
+
+    def _reload_locked(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            self._entries = json.load(f)
+        self._mtime = mtime
+        self.generation += 1
+        return True
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def get(self, sha256: str) -> Optional[dict]:
+        self.refresh()
+        entry = self._entries.get(sha256)
+        # A manifest entry is only usable while its extracted text is still on disk, and not
+        # once retired: its chunks may have been deleted from the vector store
+        if entry is None or not entry["sources"] or not os.path.exists(entry["text_file"]):
+            return None
+        return entry
+
+    def _retire_locked(self, sha256: str, directory: str, filename: str) -> List[str]:
+        # Detach the name from other content; returns the chunk IDs of content left without sources
+        retired = []
+        for other, entry in self._entries.items():
+            if other == sha256 or not entry["sources"]:
+                continue
+            entry["sources"] = [s for s in entry["sources"]
+                                if s["directory"] != directory or s["filename"] != filename]
+            if not entry["sources"]:
+                retired.extend(entry["chunk_ids"])
+        return retired
+
+    def record(self, sha256: str, text_file: str, chunk_ids: List[str], directory: str, filename: str) -> List[str]:
+        """Record newly ingested content; returns the chunk IDs of content it retired."""
+        with self._lock:
+            self._reload_locked()
+            self._entries[sha256] = {
+                "text_file": text_file,
+                "chunk_ids": chunk_ids,
+                "sources": [{"directory": directory, "filename": filename, "uploaded_at": time.time()}],
+            }
+            retired = self._retire_locked(sha256, directory, filename)
+            self._save()
+            return retired
+
+    def add_source(self, sha256: str, directory: str, filename: str) -> Tuple[bool, List[str]]:
+        """Attach another directory/filename to known content.
+
+        Returns whether it was newly attached, and the chunk IDs of content it retired.
+        Uploading attached content again still makes it the newest upload of that name.
+        """
+        with self._lock:
+            self._reload_locked()
+            sources = self._entries[sha256]["sources"]
+            attached = [s for s in sources if s["directory"] == directory and s["filename"] == filename]
+            if attached:
+                attached[0]["uploaded_at"] = time.time()
+            else:
+                sources.append({"directory": directory, "filename": filename, "uploaded_at": time.time()})
+            retired = self._retire_locked(sha256, directory, filename)
+            self._save()
+            return not attached, retired
+
+    def text_file_for(self, directory: Optional[str], filename: str) -> Optional[str]:
+        # Extracted text of the newest upload of a document, including re-uploads under another name
+        self.refresh()
+        newest, text_file = None, None
+        for entry in self._entries.values():
+            for source in entry["sources"]:
+                if source["filename"] == filename and (directory is None or source["directory"] == directory):
+                    # Sources recorded before upload times were kept count as oldest
+                    uploaded_at = source.get("uploaded_at", 0.0)
+                    if newest is None or uploaded_at > newest:
+                        newest, text_file = uploaded_at, entry["text_file"]
+        return text_file
+
+    def text_files_for(self, directory: Optional[str] = None, filename: Optional[str] = None) -> List[str]:
+        self.refresh()
+        return [self._entries[sha256]["text_file"] for sha256 in self.hashes_for(directory, filename)]
+
+    def chunk_ids(self, hashes: List[str]) -> List[str]:
+        return [chunk_id for sha256 in hashes for chunk_id in self._entries[sha256]["chunk_ids"]]
+
+    def retired_hashes(self) -> List[str]:
+        return [sha256 for sha256, entry in self._entries.items() if not entry["sources"]]
+
+    def hashes_for(self, directory: Optional[str] = None, filename: Optional[str] = None) -> List[str]:
+        # Every content hash currently uploaded under the given scope
+        return [
+            sha256 for sha256, entry in self._entries.items()
+            if any((directory is None or s["directory"] == directory)
+                   and (filename is None or s["filename"] == filename)
+                   for s in entry["sources"])
+        ]
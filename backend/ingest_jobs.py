@@ -0,0 +1,229 @@
+# Persistent ingest job queue (SQLite) drained by a bounded pool of asyncio workers
+#
+# Jobs survive restarts: a job is leased to the worker running it and the lease is renewed
+# while it runs, so a job left behind by a crashed process is picked up again once its
+# lease expires. Handlers must be safe to re-run from the start.
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from typing import Awaitable, Callable, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+INGEST_JOBS_DB = os.getenv("INGEST_JOBS_DB", "ingest_jobs.sqlite3")
+# Jobs processed at once per server process
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", os.getenv("INGEST_WORKERS", "2")))
+INGEST_JOB_ATTEMPTS = int(os.getenv("INGEST_JOB_ATTEMPTS", "3"))
+# A running job whose lease is not renewed for this long is handed to another worker
+LEASE_SECONDS = 30.0
+# Idle workers look for new or retried jobs (including other processes' uploads) this often
+POLL_INTERVAL = 1.0
+# Page progress is written at most this often per job
+PROGRESS_INTERVAL = 0.5
+RETRY_BACKOFF_MAX = 60.0
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    pdf_path TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    pages_total INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, available_at);
+"""
+# Fields reported by /jobs/{id}
+PUBLIC_FIELDS = ("id", "status", "stage", "directory", "filename", "sha256", "pages_done", "pages_total",
+                 "attempts", "result", "error", "created_at", "updated_at")
+
+
+class JobFailed(Exception):
+    """Raised by a handler when retrying cannot help (e.g. the PDF has no text)."""
+
+
+class IngestJobs:
+    """SQLite-backed ingest queue; `start(handler)` runs jobs on `workers` asyncio tasks."""
+
+    def __init__(self, path: str = INGEST_JOBS_DB, workers: int = INGEST_JOB_WORKERS,
+                 max_attempts: int = INGEST_JOB_ATTEMPTS):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._tasks = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_progress: Dict[str, float] = {}
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call; safe from any thread or process
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql: str, params=()) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute(sql, params).rowcount
+
+    @staticmethod
+    def _public(row: sqlite3.Row) -> dict:
+        job = {field: row[field] for field in PUBLIC_FIELDS}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def create(self, directory: str, filename: str, pdf_path: str, sha256: str,
+               result: Optional[dict] = None) -> dict:
+        """Queue a job, or record one that is already done when `result` is given."""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        status, stage = (DONE, DONE) if result is not None else (QUEUED, QUEUED)
+        self._execute(
+            "INSERT INTO jobs (id, status, stage, directory, filename, pdf_path, sha256, result,"
+            " available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, status, stage, directory, filename, pdf_path, sha256,
+             json.dumps(result) if result is not None else None, now, now, now))
+        if self._wakeup is not None and result is None:
+            # Called from threadpool threads; asyncio.Event is not thread-safe
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._public(row) if row is not None else None
+
+    def set_stage(self, job_id: str, stage: str):
+        self._execute("UPDATE jobs SET stage = ?, updated_at = ? WHERE id = ? AND status = ?",
+                      (stage, time.time(), job_id, RUNNING))
+
+    def report_pages(self, job_id: str, pages_done: int, pages_total: int):
+        # Called from the extraction thread for every page; throttled
+        now = time.time()
+        if pages_done < pages_total and now - self._last_progress.get(job_id, 0.0) < PROGRESS_INTERVAL:
+            return
+        self._last_progress[job_id] = now
+        self._execute("UPDATE jobs SET pages_done = ?, pages_total = ?, updated_at = ? WHERE id = ?",
+                      (pages_done, pages_total, now, job_id))
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        # Oldest queued job that is due, or a running job whose worker went away. Copies of the
+        # same PDF wait for the running one, then find its content already ingested.
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE ((status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?))"
+                " AND sha256 NOT IN (SELECT sha256 FROM jobs WHERE status = ? AND lease_until >= ?)"
+                " ORDER BY available_at LIMIT 1", (QUEUED, now, RUNNING, now, RUNNING, now)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, pages_done = 0, error = NULL,"
+                    " lease_until = ?, updated_at = ? WHERE id = ?",
+                    (RUNNING, now + LEASE_SECONDS, now, row["id"]))
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+        return row
+
+    def _renew(self, job_id: str):
+        self._execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?",
+                      (time.time() + LEASE_SECONDS, job_id, RUNNING))
+
+    def _finish(self, job_id: str, result: dict):
+        self._execute("UPDATE jobs SET status = ?, stage = ?, result = ?, lease_until = NULL, updated_at = ?"
+                      " WHERE id = ?", (DONE, DONE, json.dumps(result), time.time(), job_id))
+
+    def _fail(self, job_id: str, attempts: int, error: str, retry: bool):
+        now = time.time()
+        if retry and attempts < self.max_attempts:
+            # Back off, keeping the stage the job failed in for /jobs/{id}
+            delay = min(RETRY_BACKOFF_MAX, 2.0 ** attempts)
+            self._execute("UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_until = NULL,"
+                          " updated_at = ? WHERE id = ?", (QUEUED, error, now + delay, now, job_id))
+        else:
+            self._execute("UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ?"
+                          " WHERE id = ?", (FAILED, error, now, job_id))
+
+    def _release(self, job_id: str):
+        # Shutting down mid-job: hand it straight back to the queue for the next start
+        self._execute("UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), lease_until = NULL,"
+                      " available_at = ?, updated_at = ? WHERE id = ? AND status = ?",
+                      (QUEUED, time.time(), time.time(), job_id, RUNNING))
+
+    async def _run(self, row: sqlite3.Row, handler):
+        job_id = row["id"]
+        if row["attempts"] > self.max_attempts:
+            # Its earlier runs died with their worker process
+            await run_in_threadpool(self._fail, job_id, row["attempts"],
+                                    row["error"] or "Worker stopped while processing the job", False)
+            return
+        task = asyncio.create_task(handler(dict(row)))
+        self._running[job_id] = task
+        try:
+            # Keep the lease while the handler runs
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=LEASE_SECONDS / 3)
+                if done:
+                    break
+                await run_in_threadpool(self._renew, job_id)
+            try:
+                result = task.result()
+            except JobFailed as e:
+                await run_in_threadpool(self._fail, job_id, row["attempts"], str(e), False)
+            except Exception as e:
+                print(f"Ingest job {job_id} failed (attempt {row['attempts']}): {e}")
+                await run_in_threadpool(self._fail, job_id, row["attempts"], str(e), True)
+            else:
+                await run_in_threadpool(self._finish, job_id, result)
+        finally:
+            self._running.pop(job_id, None)
+            self._last_progress.pop(job_id, None)
+
+    async def _worker(self, handler):
+        while True:
+            try:
+                row = await run_in_threadpool(self._claim)
+            except sqlite3.OperationalError as e:
+                print(f"Ingest queue unavailable: {e}")
+                row = None
+            if row is not None:
+                await self._run(row, handler)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self, handler: Callable[[dict], Awaitable[dict]]):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(handler)) for _ in range(self.workers)]
+
+    async def stop(self):
+        running = list(self._running)
+        for task in self._tasks + list(self._running.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for job_id in running:
+            await run_in_threadpool(self._release, job_id)
+        self._tasks = []
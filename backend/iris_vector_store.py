@@ -0,0 +1,48 @@
+# IRISVector whose searches can be scoped by chunk ID
+#
+# langchain_iris turns a metadata filter into LIKE '%"key": "value"%' over the JSON metadata
+# column: every row is scanned, and "%" or "_" in a value also match other values. Scoped
+# searches here filter on the primary key instead, with the chunk IDs of the documents in scope.
+import json
+import os
+from typing import List, Optional, Tuple
+
+from langchain.docstore.document import Document
+from langchain_iris import IRISVector
+from sqlalchemy import asc
+from sqlalchemy.orm import Session
+
+# Chunk IDs per IN (...) list; larger scopes are searched in several queries
+IRIS_ID_BATCH = int(os.getenv("IRIS_ID_BATCH", "500"))
+
+
+class ScopedIRISVector(IRISVector):
+    """IRISVector that also accepts filter={"id": [chunk IDs]}, matched on the primary key."""
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        if not filter or set(filter) != {"id"}:
+            return super().similarity_search_with_score_by_vector(embedding, k=k, filter=filter)
+        ids = list(filter["id"])
+        embedding = [float(v) for v in embedding]
+        results = []
+        for start in range(0, len(ids), IRIS_ID_BATCH):
+            results += self._search_ids(embedding, k, ids[start:start + IRIS_ID_BATCH])
+        return sorted(results, key=lambda result: result[1])[:k]
+
+    def _search_ids(self, embedding: List[float], k: int, ids: List[str]) -> List[Tuple[Document, float]]:
+        # Same query as IRISVector's, with the id column in place of the metadata LIKEs
+        table = self.table
+        distance = (self.distance_strategy(embedding) if self.native_vector
+                    else table.c.embedding.func(self.distance_strategy, embedding)).label("distance")
+        with Session(self._conn) as session:
+            rows = (session.query(table, distance)
+                    .filter(table.c.id.in_(ids))
+                    .order_by(asc("distance"))
+                    .limit(k)
+                    .all())
+        return [
+            (Document(page_content=row.document, metadata=json.loads(row.metadata), id=row.id),
+             round(float(row.distance), 15) if self.embedding_function is not None else None)
+            for row in rows
+        ]
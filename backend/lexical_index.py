@@ -0,0 +1,261 @@
+# Incremental BM25 inverted index over the ingested chunks, persisted as an append-only log
+#
+# Rebuild from the vector store / extracted texts with:
+#   python lexical_index.py rebuild
+import argparse
+import fcntl
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from local_vector_store import INDEXED_METADATA, LOCAL_INDEX_DIR, _matches, _top_k
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "lexical_index")
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Best-to-second BM25 score ratio needed for full confidence in the best chunk
+LEXICAL_MARGIN = float(os.getenv("LEXICAL_MARGIN", "1.5"))
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it its me my of on or "
+    "our so than that the their them then there these they this to was we were what when where "
+    "which who why will with you your about into explain describe define tell give could would "
+    "should please show example mean meaning something thing".split()
+)
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    # Lowercased words without stopwords; plural "s" stripped so "eigenvalues" finds "eigenvalue"
+    terms = []
+    for term in TOKEN.findall(text.lower()):
+        if term in STOPWORDS:
+            continue
+        if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+class LexicalIndex:
+    """BM25 over chunk texts; other worker processes' appends are picked up before each search."""
+
+    def __init__(self, directory: str = LEXICAL_INDEX_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._log_path = os.path.join(directory, "postings.jsonl")
+        self._lock_path = os.path.join(directory, "lock")
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._ids: List[str] = []
+        self._id_set: Set[str] = set()
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._lengths: List[int] = []
+        self._total_length = 0
+        # term -> rows containing it, and the term frequency in each of those rows
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._frequencies: Dict[str, List[int]] = defaultdict(list)
+        self._partitions: Dict[tuple, List[int]] = defaultdict(list)
+        # Chunk lengths as an array, rebuilt when rows are added
+        self._length_array = np.empty(0, dtype=np.float32)
+        with self._lock:
+            self._refresh_locked()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append_record(self, record: dict):
+        row = len(self._ids)
+        self._ids.append(record["id"])
+        self._id_set.add(record["id"])
+        self._texts.append(record["text"])
+        self._metadatas.append(record["metadata"])
+        self._lengths.append(record["length"])
+        self._total_length += record["length"]
+        for term, frequency in record["tf"].items():
+            self._postings[term].append(row)
+            self._frequencies[term].append(frequency)
+        for key in INDEXED_METADATA:
+            if key in record["metadata"]:
+                self._partitions[(key, record["metadata"][key])].append(row)
+
+    def refresh(self):
+        try:
+            if os.path.getsize(self._log_path) == self._offset:
+                return
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        if not os.path.exists(self._log_path):
+            return
+        with open(self._log_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            self._append_record(json.loads(line))
+        self._offset += end
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict], only_if_empty: bool = False) -> int:
+        records = []
+        for id_, text, metadata in zip(ids, texts, metadatas):
+            terms = tokenize(text)
+            records.append({"id": id_, "text": text, "metadata": metadata,
+                            "length": len(terms), "tf": dict(Counter(terms))})
+        with self._lock, self._file_lock():
+            self._refresh_locked()
+            if only_if_empty and self._ids:
+                return 0
+            # Chunks already indexed (a retried ingest) are not added twice
+            records = [record for record in records if record["id"] not in self._id_set]
+            with open(self._log_path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            self._offset = os.path.getsize(self._log_path)
+            for record in records:
+                self._append_record(record)
+        return len(records)
+
+    def _allowed_rows(self, filter: dict, count: int) -> np.ndarray:
+        rows = None
+        residual = {}
+        for key, value in filter.items():
+            if key not in INDEXED_METADATA:
+                residual[key] = value
+                continue
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            partition = np.unique(np.asarray(
+                [row for v in values for row in self._partitions.get((key, v), [])], dtype=np.int64))
+            rows = partition if rows is None else np.intersect1d(rows, partition, assume_unique=True)
+        rows = np.arange(count) if rows is None else rows[rows < count]
+        if residual:
+            rows = np.fromiter((i for i in rows if _matches(self._metadatas[i], residual)), dtype=np.int64)
+        return rows
+
+    def search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> Tuple[List[Tuple[Document, float]], float]:
+        """Top-k chunks by BM25 (higher is better), and a confidence in the best chunk.
+
+        The confidence is the share of the query's IDF mass that the best chunk matches,
+        scaled down unless its score beats the runner-up by LEXICAL_MARGIN: a term found in
+        many chunks matches all of them about equally and says little about which is meant.
+        """
+        self.refresh()
+        count = len(self._ids)
+        terms = list(dict.fromkeys(tokenize(query)))
+        if count == 0 or not terms:
+            return [], 0.0
+
+        average_length = self._total_length / count or 1.0
+        if len(self._length_array) != count:
+            self._length_array = np.asarray(self._lengths[:count], dtype=np.float32)
+        lengths = self._length_array
+        scores = np.zeros(count, dtype=np.float32)
+        idfs = {}
+        for term in terms:
+            rows = np.asarray(self._postings.get(term, ()), dtype=np.int64)
+            rows = rows[rows < count]
+            idfs[term] = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+            if len(rows) == 0:
+                continue
+            frequencies = np.asarray(self._frequencies[term][:len(rows)], dtype=np.float32)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / average_length)
+            scores[rows] += idfs[term] * frequencies * (BM25_K1 + 1) / (frequencies + norm)
+
+        if filter:
+            allowed = self._allowed_rows(filter, count)
+            if len(allowed) == 0:
+                return [], 0.0
+            masked = np.full(count, -1.0, dtype=np.float32)
+            masked[allowed] = scores[allowed]
+            scores = masked
+        top = [i for i in _top_k(scores, max(k, 2)).tolist() if scores[i] > 0]
+        if not top:
+            return [], 0.0
+
+        best_terms = set(tokenize(self._texts[top[0]]))
+        confidence = sum(idf for term, idf in idfs.items() if term in best_terms) / (sum(idfs.values()) or 1.0)
+        if len(top) > 1:
+            margin = float(scores[top[0]] / scores[top[1]])
+            confidence *= min(1.0, margin / LEXICAL_MARGIN)
+        results = [
+            (Document(page_content=self._texts[i], metadata=self._metadatas[i], id=self._ids[i]), float(scores[i]))
+            for i in top[:k]
+        ]
+        return results, confidence
+
+
+def backfill(index: LexicalIndex, manifest_path: Optional[str] = None) -> int:
+    """Index the existing corpus once: exact chunks from the local vector store when present,
+    otherwise extracted texts listed in the ingest manifest, re-chunked as ingest does."""
+    docs_path = os.path.join(LOCAL_INDEX_DIR, "docs.jsonl")
+    ids, texts, metadatas = [], [], []
+    if os.path.exists(docs_path):
+        with open(docs_path, encoding="utf-8") as f:
+            for line in f:
+                if line.endswith("\n"):
+                    record = json.loads(line)
+                    ids.append(record["id"])
+                    texts.append(record["text"])
+                    metadatas.append(record["metadata"])
+    else:
+        from chunking import chunk_documents
+        from extraction import PAGE_BREAK, iter_page_documents
+        from ingest_cache import INGEST_MANIFEST, IngestManifest, chunk_ids_for
+        manifest = IngestManifest(manifest_path or INGEST_MANIFEST)
+        for sha256 in manifest.hashes_for():
+            entry = manifest.get(sha256)
+            if entry is None:
+                continue
+            # Chunk the pages the way ingest did, so texts, IDs and page numbers match the
+            # vector store's and fusion merges the two rankings. Texts written before
+            # PAGE_BREAK existed come back as one page and may chunk slightly differently.
+            with open(entry["text_file"], encoding="utf-8") as f:
+                pages = list(enumerate(f.read().split(PAGE_BREAK)))
+            source = entry["sources"][0]
+            metadata = {"filename": source["filename"], "directory": source["directory"], "sha256": sha256}
+            docs = chunk_documents(iter_page_documents(pages, metadata))
+            chunk_ids = entry.get("chunk_ids") or []
+            if len(chunk_ids) != len(docs):
+                chunk_ids = chunk_ids_for(sha256, len(docs))
+            ids.extend(chunk_ids)
+            texts.extend(doc.page_content for doc in docs)
+            metadatas.extend(doc.metadata for doc in docs)
+    if not texts:
+        return 0
+    return index.add(ids, texts, metadatas, only_if_empty=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the BM25 lexical index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="index the existing corpus into an empty lexical index")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        added = backfill(LexicalIndex())
+        print(f"Indexed {added} chunks" if added else "Nothing to index (corpus empty or index already built)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+# In-process vector store: memory-mapped float32 matrix of normalized rows
+import fcntl
+import json
+import os
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+# "flat" scans every row; "ivf" only scans the nprobe closest clusters
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "flat")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "64"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+# Below this many rows per list k-means is not worth it and search stays flat
+IVF_MIN_ROWS_PER_LIST = 32
+# Metadata keys with an inverted index for filtered search
+INDEXED_METADATA = ("directory", "filename", "sha256")
+INITIAL_CAPACITY = 1024
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # argpartition is O(n); only the k winners get sorted
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _matches(metadata: dict, filter: dict) -> bool:
+    for key, value in filter.items():
+        if isinstance(value, (list, tuple, set)):
+            if metadata.get(key) not in value:
+                return False
+        elif metadata.get(key) != value:
+            return False
+    return True
+
+
+class IVFIndex:
+    """Coarse k-means quantizer over the normalized rows."""
+
+    def __init__(self, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_rows = 0
+        self._lists = None
+
+    def train(self, vectors: np.ndarray, iterations: int = 10, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        nlist = min(self.nlist, len(vectors))
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = vectors[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+        self.trained_rows = len(vectors)
+        self._lists = None
+
+    def assign(self, vectors: np.ndarray):
+        new = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+        self.assignments = np.concatenate([self.assignments, new])
+        self._lists = None
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        # Inverted lists: rows sorted by cluster plus per-cluster offsets
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(self.assignments, minlength=len(self.centroids)))])
+            self._lists = (order, offsets)
+        order, offsets = self._lists
+        probe = _top_k(self.centroids @ query, self.nprobe)
+        return np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe])
+
+    def save(self, path: str):
+        np.savez(path, centroids=self.centroids, assignments=self.assignments,
+                 trained_rows=np.int64(self.trained_rows))
+
+    def load(self, path: str):
+        data = np.load(path)
+        self.centroids = data["centroids"]
+        self.assignments = data["assignments"]
+        self.trained_rows = int(data["trained_rows"])
+        self._lists = None
+
+
+class LocalVectorStore(VectorStore):
+    """Drop-in for IRISVector on a single node.
+
+    Scores are cosine distances (lower is closer), matching what IRISVector returns.
+    """
+
+    def __init__(self, embedding: Embeddings, directory: str = LOCAL_INDEX_DIR,
+                 mode: str = LOCAL_INDEX_MODE, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE):
+        self.embedding = embedding
+        self.directory = directory
+        self.mode = mode
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(directory, "vectors.npy")
+        self._docs_path = os.path.join(directory, "docs.jsonl")
+        self._ivf_path = os.path.join(directory, "ivf.npz")
+        self._matrix: Optional[np.ndarray] = None
+        self._count = 0
+        self._ids: List[str] = []
+        self._id_set: Set[str] = set()
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        # (metadata key, value) -> rows; lets scoped searches scan only their partition
+        self._partitions: Dict[Tuple[str, Any], List[int]] = defaultdict(list)
+        self._lock_path = os.path.join(directory, "lock")
+        self._docs_offset = 0
+        self._vectors_inode = None
+        self._ivf_mtime = None
+        self._ivf = IVFIndex(nlist, nprobe) if mode == "ivf" else None
+        with self._lock:
+            self._refresh_locked()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _append_record(self, id_: str, text: str, metadata: dict):
+        row = len(self._ids)
+        self._ids.append(id_)
+        self._id_set.add(id_)
+        self._texts.append(text)
+        self._metadatas.append(metadata)
+        for key in INDEXED_METADATA:
+            if key in metadata:
+                self._partitions[(key, metadata[key])].append(row)
+
+    @contextmanager
+    def _file_lock(self):
+        # Serializes writers across uvicorn worker processes sharing the directory
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stale(self) -> bool:
+        try:
+            return (os.path.getsize(self._docs_path) != self._docs_offset
+                    or os.stat(self._vectors_path).st_ino != self._vectors_inode)
+        except FileNotFoundError:
+            return False
+
+    def refresh(self):
+        """Pick up rows appended by other processes sharing the same directory."""
+        if not self._stale():
+            return
+        with self._lock:
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        if os.path.exists(self._docs_path):
+            with open(self._docs_path, "rb") as f:
+                f.seek(self._docs_offset)
+                data = f.read()
+            # A writer may be mid-line; only consume complete records
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                record = json.loads(line)
+                self._append_record(record["id"], record["text"], record["metadata"])
+            self._docs_offset += end
+        if os.path.exists(self._vectors_path):
+            inode = os.stat(self._vectors_path).st_ino
+            if inode != self._vectors_inode:
+                self._matrix = np.load(self._vectors_path, mmap_mode="r+")
+                self._vectors_inode = inode
+        # docs.jsonl is written after the vectors, so its length is the committed row count
+        self._count = len(self._ids)
+        if self._ivf is not None:
+            self._refresh_ivf()
+
+    def _refresh_ivf(self):
+        if os.path.exists(self._ivf_path):
+            mtime = os.path.getmtime(self._ivf_path)
+            if mtime != self._ivf_mtime:
+                self._ivf.load(self._ivf_path)
+                self._ivf_mtime = mtime
+        assigned = len(self._ivf.assignments)
+        if self._ivf.centroids is not None and assigned < self._count:
+            self._ivf.assign(np.asarray(self._matrix[assigned:self._count]))
+
+    def _ensure_capacity(self, rows: int, dim: int):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(INITIAL_CAPACITY, capacity)
+        while new_capacity < rows:
+            new_capacity *= 2
+        tmp_path = f"{self._vectors_path}.tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(new_capacity, dim))
+        if self._matrix is not None:
+            grown[:self._count] = self._matrix[:self._count]
+        grown.flush()
+        del grown
+        os.replace(tmp_path, self._vectors_path)
+        self._matrix = np.load(self._vectors_path, mmap_mode="r+")
+        self._vectors_inode = os.stat(self._vectors_path).st_ino
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]],
+                       metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+
+        with self._lock, self._file_lock():
+            self._refresh_locked()
+            # Rows whose id is already stored are skipped, so a retried ingest adds nothing twice
+            keep = [i for i, id_ in enumerate(ids) if id_ not in self._id_set]
+            if not keep:
+                return ids
+            ids_to_add = [ids[i] for i in keep]
+            texts, metadatas, vectors = [texts[i] for i in keep], [metadatas[i] for i in keep], vectors[keep]
+            start, stop = self._count, self._count + len(texts)
+            self._ensure_capacity(stop, vectors.shape[1])
+            self._matrix[start:stop] = vectors
+            self._matrix.flush()
+            with open(self._docs_path, "a", encoding="utf-8") as f:
+                for id_, text, metadata in zip(ids_to_add, texts, metadatas):
+                    f.write(json.dumps({"id": id_, "text": text, "metadata": metadata}) + "\n")
+            self._docs_offset = os.path.getsize(self._docs_path)
+            for id_, text, metadata in zip(ids_to_add, texts, metadatas):
+                self._append_record(id_, text, metadata)
+            self._count = stop
+            if self._ivf is not None:
+                self._update_ivf(vectors)
+        return ids
+
+    def _update_ivf(self, new_vectors: np.ndarray):
+        # Retrain once the corpus has doubled since the last k-means run
+        if self._count < self._ivf.nlist * IVF_MIN_ROWS_PER_LIST:
+            self._ivf.centroids = None
+            return
+        if self._ivf.centroids is None or self._count >= 2 * self._ivf.trained_rows:
+            self._ivf.train(np.asarray(self._matrix[:self._count]))
+        else:
+            self._ivf.assign(new_vectors)
+        self._ivf.save(self._ivf_path)
+        self._ivf_mtime = os.path.getmtime(self._ivf_path)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas, ids)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def _filter_rows(self, filter: dict, count: int) -> np.ndarray:
+        rows = None
+        residual = {}
+        for key, value in filter.items():
+            if key not in INDEXED_METADATA:
+                residual[key] = value
+                continue
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            if not values:
+                return np.empty(0, dtype=np.int64)
+            partition = np.unique(np.concatenate(
+                [np.asarray(self._partitions.get((key, v), []), dtype=np.int64) for v in values]
+            ))
+            rows = partition if rows is None else np.intersect1d(rows, partition, assume_unique=True)
+        rows = np.arange(count) if rows is None else rows[rows < count]
+        if residual:
+            rows = np.fromiter((i for i in rows if _matches(self._metadatas[i], residual)), dtype=np.int64)
+        return rows
+
+    def _candidate_rows(self, query: np.ndarray, filter: Optional[dict], count: int) -> Optional[np.ndarray]:
+        # Scoped searches scan their partition exactly; unscoped ones may use IVF
+        if filter:
+            return self._filter_rows(filter, count)
+        if self._ivf is not None and self._ivf.centroids is not None:
+            rows = self._ivf.candidates(query)
+            # Another process may have saved assignments for rows not yet loaded here
+            return rows[rows < count]
+        return None
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        self.refresh()
+        if self._count == 0:
+            return []
+        query = _normalize(np.asarray([embedding], dtype=np.float32))[0]
+        count = self._count
+        rows = self._candidate_rows(query, filter, count)
+        if rows is None:
+            scores = self._matrix[:count] @ query
+            top = _top_k(scores, k)
+            top_scores = scores[top]
+        else:
+            if len(rows) == 0:
+                return []
+            scores = self._matrix[rows] @ query
+            order = _top_k(scores, k)
+            top, top_scores = rows[order], scores[order]
+        return self._results(top, top_scores)
+
+    def similarity_search_with_score_by_vectors(self, embeddings: List[List[float]], k: int = 4,
+                                                filter: Optional[dict] = None) -> List[List[Tuple[Document, float]]]:
+        # Many queries in one pass: the candidate rows are gathered once and scored in one matrix product
+        self.refresh()
+        if self._count == 0:
+            return [[] for _ in embeddings]
+        if not filter and self._ivf is not None and self._ivf.centroids is not None:
+            # IVF candidates differ per query
+            return [self.similarity_search_with_score_by_vector(embedding, k, filter) for embedding in embeddings]
+        queries = _normalize(np.asarray(embeddings, dtype=np.float32))
+        count = self._count
+        rows = self._filter_rows(filter, count) if filter else None
+        if rows is not None and len(rows) == 0:
+            return [[] for _ in embeddings]
+        scores = (self._matrix[:count] if rows is None else self._matrix[rows]) @ queries.T
+        results = []
+        for column in scores.T:
+            order = _top_k(column, k)
+            results.append(self._results(order if rows is None else rows[order], column[order]))
+        return results
+
+    def _results(self, top: np.ndarray, top_scores: np.ndarray) -> List[Tuple[Document, float]]:
+        return [
+            (Document(page_content=self._texts[i], metadata=self._metadatas[i], id=self._ids[i]), 1.0 - score)
+            for i, score in zip(top.tolist(), top_scores.tolist())
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
@@ -1,80 +1,431 @@
 # Import necessary libraries
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import functools
 import os
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
-import uuid
-import easyocr
-from pdf2image import convert_from_path
-import numpy as np
 import json
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 from pydantic import BaseModel
 from langchain.docstore.document import Document
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.chat_models import ChatOpenAI
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-from langchain_iris import IRISVector
+import extraction
+from extraction import count_pages, extract_pages, iter_page_documents
+from chunking import chunk_documents
+from ocr_service import fill_empty_pages, get_ocr_service
+from ingest_cache import IngestManifest, chunk_ids_for, save_upload
+from ingest_jobs import IngestJobs, JobFailed
+from embedding_cache import CachedEmbeddings
+from local_vector_store import LocalVectorStore
+from lexical_index import LexicalIndex, backfill as backfill_lexical_index, tokenize
+from concurrency import EndpointLimiter, ingest_executor, run_blocking
+from answer_cache import AnswerCache
+from summaries import SummaryBuilder, failed as summary_failed, load_summary, retry_due
+from question_bank import QuestionBank
+from providers import make_embeddings, make_llm, make_tts
+from shared.audio_cache import MEDIA_TYPES, AudioCache, audio_key
+from metrics import MetricsMiddleware, TokenUsageCallback, count, render_metrics, stage, timed_iter, traced
 
 # Load environment variables
 load_dotenv(override=True)
 
-# Initialize FastAPI
-app = FastAPI()
 
-from fastapi.middleware.cors import CORSMiddleware
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Reconnect to the stored corpus, then warm heavy components without delaying /healthz
+    await run_in_threadpool(rehydrate_vector_store)
+    if len(lexical_index) == 0 and ingest_manifest.hashes_for():
+        # Corpus ingested before the lexical index existed
+        asyncio.create_task(run_blocking(ingest_executor, backfill_lexical_index, lexical_index))
+    warmup_task = asyncio.create_task(warm_up()) if WARMUP else None
+    if warmup_task is None:
+        readiness["ready"] = True
+    # Uploads queued before a restart resume here
+    await ingest_jobs.start(run_ingest_job)
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await ingest_jobs.stop()
+    await run_in_threadpool(embeddings.store.flush)
+
 
 # Initialize FastAPI and add CORS middleware
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
+# Per-stage timings for these endpoints; see /metrics and the X-Profile request header
+app.add_middleware(MetricsMiddleware, endpoints={
+    "/upload": "upload", "/query": "query", "/query/stream": "query_stream", "/query/batch": "query_batch",
+    "/qa": "qa", "/mcq": "mcq", "/summary": "summary", "/summary/audio": "summary_audio",
+})
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],  # Adjust with your frontend URL
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile"],
 )
 
 # Constants
+# Uploaded PDFs and their extracted text are stored under their content hash
 UPLOAD_DIR = "uploaded_files"
 EXTRACTED_TEXT_DIR = "extracted_texts"
 COLLECTION_NAME = "document_store"
 IRIS_CONNECTION_STRING = os.getenv("CONNECTION_STRING")
+# "iris" (default) or "local" for the embedded LocalVectorStore
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "iris")
+# Dimension of OpenAIEmbeddings vectors; lets IRISVector open without a probe embedding
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+# WARMUP=1 starts the PDF workers and embedding client before reporting ready;
+# WARMUP_OCR=1 also loads the EasyOCR models (slow, pulls in torch)
+WARMUP = os.getenv("WARMUP", "0") == "1"
+WARMUP_OCR = os.getenv("WARMUP_OCR", "0") == "1"
+# "hybrid" fuses BM25 and vector results, "vector" or "lexical" use one retriever only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# LEXICAL_FAST_PATH=1: in hybrid mode, answer from BM25 alone (no query embedding) when the
+# best lexical hit contains every term of a short query and clearly outscores the next one.
+# Off by default: a keyword match can still miss what a conversational question is asking.
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "0") == "1"
+LEXICAL_FAST_PATH_MAX_TERMS = int(os.getenv("LEXICAL_FAST_PATH_MAX_TERMS", "3"))
+LEXICAL_CONFIDENCE = float(os.getenv("LEXICAL_CONFIDENCE", "1.0"))
+# Reciprocal rank fusion constant
+RRF_K = 60
+# /query/batch: questions per request, and answers generated at once per request
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "50"))
+QUERY_BATCH_LLM_CONCURRENCY = int(os.getenv("QUERY_BATCH_LLM_CONCURRENCY", "8"))
 
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(EXTRACTED_TEXT_DIR, exist_ok=True)
 
-# Initialize LangChain components
-embeddings = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
-llm = ChatOpenAI(
-    temperature=0, 
-    model_name="gpt-3.5-turbo", 
-    openai_api_key=os.getenv("OPENAI_API_KEY")
+# Initialize LangChain components (LLM_PROVIDER / EMBEDDING_PROVIDER=fake for offline runs)
+embeddings = CachedEmbeddings(make_embeddings(EMBEDDING_DIMENSION))
+llm = make_llm(callbacks=[TokenUsageCallback()])
+
+# Prompts and chains are built once and shared by every request
+query_prompt = PromptTemplate(
+    input_variables=["context", "question"],
+    template="Use the following context to answer the user's question.\n\nContext: {context}\n\nQuestion: {question}\n\nAnswer:"
+)
+qa_prompt = PromptTemplate(
+    input_variables=["context"],
+    template="Generate 3 open-ended questions based on the following text. For each question, also provide a concise answer. Format your response as JSON:\n\n{context}"
+)
+mcq_prompt = PromptTemplate(
+    input_variables=["context", "num_questions"],
+    template="""Create {num_questions} multiple-choice questions with 4 options each based on the following text. Give options in only one word. Format your response as a JSON list of questions:
+
+        [
+            {{
+                "question": "Your question here",
+                "choices": {{
+                    "A": "First option",
+                    "B": "Second option",
+                    "C": "Third option",
+                    "D": "Fourth option"
+                }},
+                "correct_answer": "A"
+            }},
+            // More questions...
+        ]
+
+        Text: {context}"""
+)
+summary_prompt = PromptTemplate(
+    input_variables=["context"],
+    template="Provide a comprehensive summary of the following text:\n\n{context}"
+)
+query_chain = LLMChain(llm=llm, prompt=query_prompt)
+qa_chain = LLMChain(llm=llm, prompt=qa_prompt)
+mcq_chain = LLMChain(llm=llm, prompt=mcq_prompt)
+summary_chain = LLMChain(llm=llm, prompt=summary_prompt)
+
+# Spoken summaries (TTS_PROVIDER); synthesized audio is kept in TTS_CACHE_DIR, at most TTS_CACHE_MAX_MB
+tts = make_tts()
+audio_cache = AudioCache() if tts is not None else None
+
+# Background map-reduce summaries, stored next to the extracted text and narrated once built
+summary_builder = SummaryBuilder(llm, on_built=lambda text_path, summary: narrate_summary(text_path, summary))
+
+# Pregenerated MCQs per document, refilled in the background
+question_bank = QuestionBank(lambda context, num_questions: generate_bank_questions(context, num_questions))
+
+# Admission control: bounded in-flight requests per endpoint, 503 once the queue is full
+upload_limiter = EndpointLimiter.from_env("upload", max_concurrent=2, max_waiting=8)
+query_limiter = EndpointLimiter.from_env("query", max_concurrent=32, max_waiting=128)
+generation_limiter = EndpointLimiter.from_env("generation", max_concurrent=8, max_waiting=32)
+
+# Manifest of already-ingested PDFs, keyed by content hash
+ingest_manifest = IngestManifest()
+# Uploads are processed in the background; /jobs/{id} reports their progress
+ingest_jobs = IngestJobs()
+lexical_index = LexicalIndex()
+
+# Repeated /query questions, invalidated per course when documents are added
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600))),
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
 )
 
-# Global IRIS vector store instance
+# Global vector store instance (IRIS or local)
 vector_store = None
+# Workers that start before the first upload retry opening the store at most this often
+REHYDRATE_INTERVAL = float(os.getenv("REHYDRATE_INTERVAL", "5"))
+_last_rehydrate = float("-inf")
+
+
+def connect_vector_store():
+    # Open the configured collection without embedding anything
+    if VECTOR_BACKEND == "local":
+        return LocalVectorStore(embedding=embeddings)
+    from langchain_iris import IRISVector
+    return IRISVector(
+        embedding_function=embeddings,
+        dimension=EMBEDDING_DIMENSION,
+        collection_name=COLLECTION_NAME,
+        connection_string=IRIS_CONNECTION_STRING
+    )
+
+
+def open_vector_store():
+    # Existing collection, or None while it is still empty
+    store = connect_vector_store()
+    if VECTOR_BACKEND == "local":
+        return store if len(store) else None
+    return store if store.get(limit=1)["ids"] else None
+
+
+def get_vector_store():
+    # IRIS is shared by every worker and the local store re-reads rows other workers
+    # appended, so once a handle exists each worker answers from the same corpus
+    global vector_store, _last_rehydrate
+    if vector_store is None and time.monotonic() - _last_rehydrate >= REHYDRATE_INTERVAL:
+        _last_rehydrate = time.monotonic()
+        vector_store = open_vector_store()
+    if vector_store is None:
+        raise HTTPException(status_code=400, detail="No documents have been uploaded yet")
+    return vector_store
+
 
-def initialize_vector_store(docs):
+def initialize_vector_store(docs, ids=None, vectors=None):
 
     global vector_store
     if vector_store is None:
-        vector_store = IRISVector.from_documents(
-            embedding=embeddings,
-            documents=docs,
-            collection_name=COLLECTION_NAME,
-            connection_string=IRIS_CONNECTION_STRING
-        )
+        vector_store = connect_vector_store()
+    if vectors is None:
+        vector_store.add_documents(docs, ids=ids)
     else:
-        vector_store.add_documents(docs)
+        # Embeddings were computed asynchronously by the caller
+        vector_store.add_embeddings(
+            texts=[doc.page_content for doc in docs],
+            embeddings=vectors,
+            metadatas=[doc.metadata for doc in docs],
+            ids=ids
+        )
     return vector_store
 
 
+def delete_chunks(ids: List[str]):
+    try:
+        (vector_store if vector_store is not None else connect_vector_store()).delete(ids)
+    except Exception as e:
+        print(f"Could not delete chunks: {e}")
+
+
+def scope_filters(directory: Optional[str] = None, filename: Optional[str] = None,
+                  by_chunk_id: bool = False) -> List[Optional[dict]]:
+    # Scoped by content rather than by name: chunks keep the name they were uploaded under,
+    # but a name uploaded again with new content no longer reaches the old content.
+    # The local indexes have an inverted index on the content hash; IRIS only indexes the
+    # chunk ID (see iris_vector_store), so it is given the chunk IDs of the hashes in scope.
+    if directory is None and filename is None:
+        # IRIS deletes retired chunks; the local indexes keep them and filter them out
+        if by_chunk_id or not ingest_manifest.retired_hashes():
+            return [None]
+    hashes = ingest_manifest.hashes_for(directory, filename)
+    if by_chunk_id:
+        return [{"id": ingest_manifest.chunk_ids(hashes)}]
+    return [{"sha256": hashes}]
+
+
+def search_by_vector(store, query_embedding, k: int, filters: List[Optional[dict]]):
+    results = [result for f in filters
+               for result in store.similarity_search_with_score_by_vector(query_embedding, k=k, filter=f)]
+    return sorted(results, key=lambda result: result[1])[:k]
+
+
+def search_by_vectors(store, query_embeddings: List[List[float]], k: int, filters: List[Optional[dict]]):
+    # The local store scores every query in one matrix product per filter
+    per_query = [[] for _ in query_embeddings]
+    for f in filters:
+        for results, hits in zip(per_query, store.similarity_search_with_score_by_vectors(query_embeddings, k=k, filter=f)):
+            results += hits
+    return [sorted(results, key=lambda result: result[1])[:k] for results in per_query]
+
+
+def search_lexical(query: str, k: int, filters: List[Optional[dict]]):
+    # (results best first, confidence of the best hit)
+    results, confidence = [], 0.0
+    for f in filters:
+        hits, hit_confidence = lexical_index.search(query, k=k, filter=f)
+        if hits and (not results or hits[0][1] > results[0][1]):
+            confidence = hit_confidence
+        results += hits
+    return sorted(results, key=lambda result: -result[1])[:k], confidence
+
+
+def fuse(rankings: List[list], k: int):
+    # Reciprocal rank fusion over result lists ordered best first. The score is reported
+    # as a distance like the vector store's: 0 when ranked first by every retriever.
+    fused, docs = {}, {}
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking):
+            fused[doc.page_content] = fused.get(doc.page_content, 0.0) + 1.0 / (RRF_K + rank + 1)
+            docs.setdefault(doc.page_content, doc)
+    best = len(rankings) / (RRF_K + 1)
+    ordered = sorted(fused.items(), key=lambda item: -item[1])[:k]
+    return [(docs[text], 1.0 - score / best) for text, score in ordered]
+
+
+async def lexical_fast_path(query: str, k: int, directory: Optional[str] = None,
+                            filename: Optional[str] = None):
+    """BM25 results when they are good enough to skip the query embedding, else None."""
+    if RETRIEVAL_MODE == "vector" or len(lexical_index) == 0:
+        return None
+    filters = scope_filters(directory, filename)
+    with stage("lexical"):
+        results, confidence = await run_in_threadpool(search_lexical, query, k, filters)
+    terms = len(set(tokenize(query)))
+    if RETRIEVAL_MODE == "lexical" or (
+            LEXICAL_FAST_PATH and results and 0 < terms <= LEXICAL_FAST_PATH_MAX_TERMS
+            and confidence >= LEXICAL_CONFIDENCE):
+        count("lexical_only")
+        return fuse([results], k)
+    return None
+
+
+async def retrieve(query: str, k: int = 4, directory: Optional[str] = None, filename: Optional[str] = None,
+                   query_embedding: Optional[List[float]] = None):
+    # Search only the requested course/document; re-uploads are found through their content hash.
+    # The query is embedded asynchronously and the (IRIS network / numpy) searches run off the loop.
+    if query_embedding is None:
+        results = await lexical_fast_path(query, k, directory, filename)
+        if results is not None:
+            return results
+
+    filters = scope_filters(directory, filename, by_chunk_id=VECTOR_BACKEND != "local")
+    lexical = []
+    if RETRIEVAL_MODE == "hybrid" and len(lexical_index):
+        with stage("lexical"):
+            lexical, _ = await run_in_threadpool(
+                search_lexical, query, 2 * k, scope_filters(directory, filename))
+    try:
+        store = await run_in_threadpool(get_vector_store)
+        if query_embedding is None:
+            with stage("embed"):
+                query_embedding = await embeddings.aembed_query(query)
+        with stage("retrieve"):
+            vector = await run_in_threadpool(search_by_vector, store, query_embedding, 2 * k if lexical else k, filters)
+    except Exception as e:
+        # Embedding API or vector store degraded: keyword results are better than none
+        if not lexical:
+            raise
+        print(f"Vector retrieval failed, serving lexical results: {e}")
+        count("lexical_fallback")
+        return fuse([lexical], k)
+    if not lexical:
+        return vector
+    return fuse([vector, lexical], k)
+
+
+async def retrieve_many(queries: List[str], query_embeddings: Optional[List[List[float]]], k: int = 4,
+                        directory: Optional[str] = None, filename: Optional[str] = None):
+    # retrieve() for several queries, with the vector searches run together
+    filters = scope_filters(directory, filename, by_chunk_id=VECTOR_BACKEND != "local")
+    lexical = [[] for _ in queries]
+    if RETRIEVAL_MODE == "hybrid" and len(lexical_index):
+        lexical_filters = scope_filters(directory, filename)
+        with stage("lexical"):
+            lexical = await run_in_threadpool(
+                lambda: [search_lexical(query, 2 * k, lexical_filters)[0] for query in queries])
+    vector_k = 2 * k if any(lexical) else k
+    try:
+        store = await run_in_threadpool(get_vector_store)
+        if query_embeddings is None:
+            with stage("embed"):
+                query_embeddings = await embeddings.aembed_queries(queries)
+        with stage("retrieve"):
+            if hasattr(store, "similarity_search_with_score_by_vectors"):
+                vector = await run_in_threadpool(search_by_vectors, store, query_embeddings, vector_k, filters)
+            else:
+                # IRIS: one round trip per query, all in flight at once
+                vector = await asyncio.gather(*[
+                    run_in_threadpool(search_by_vector, store, query_embedding, vector_k, filters)
+                    for query_embedding in query_embeddings])
+    except Exception as e:
+        if not any(lexical):
+            raise
+        print(f"Vector retrieval failed, serving lexical results: {e}")
+        count("lexical_fallback")
+        return [fuse([hits], k) for hits in lexical]
+    return [fuse([hits, keyword_hits], k) if keyword_hits else hits[:k] for hits, keyword_hits in zip(vector, lexical)]
+
+
+def rehydrate_vector_store():
+    global vector_store, _last_rehydrate
+    _last_rehydrate = time.monotonic()
+    try:
+        vector_store = open_vector_store()
+    except Exception as e:
+        # Keep serving; get_vector_store() retries on the next request
+        print(f"Vector store rehydration failed: {e}")
+
+
+# Startup progress reported by /readyz
+readiness = {"ready": False, "warmup": {}}
+
+
+async def warm_up():
+    steps = [("pdf_workers", extraction.warm_up),
+             ("embeddings", lambda: embeddings.embed_query("warmup"))]
+    if WARMUP_OCR:
+        steps.append(("ocr", lambda: get_ocr_service().reader))
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            await run_in_threadpool(step)
+            readiness["warmup"][name] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            print(f"Warmup step {name} failed: {e}")
+            readiness["warmup"][name] = "failed"
+    readiness["ready"] = True
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    status_code = 200 if readiness["ready"] else 503
+    return JSONResponse(status_code=status_code, content={
+        **readiness, "vector_store": vector_store is not None
+    })
+
+
 class QuestionAnswer(BaseModel):
     question: str
     answer: str
@@ -87,98 +438,371 @@ class MultipleChoiceQuestion(BaseModel):
 class MCQResponse(BaseModel):
     multiple_choice_questions: List[MultipleChoiceQuestion]
 
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    directory: Optional[str] = None
+    filename: Optional[str] = None
+
+
+def extract_documents(pdf_path: str, text_path: str, metadata: dict,
+                      on_page: Optional[Callable[[int, int], None]] = None) -> List[Document]:
+    # Blocking: extraction fans out to the process pool, OCR runs on the shared engine
+    # Pages without a text layer are OCR'd individually, in small rasterized windows;
+    # chunks are sized in tokens and may span pages
+    with open(text_path, "w", encoding="utf-8") as text_file:
+        pages = timed_iter(extract_pages(pdf_path), "parse", counter="pages")
+        pages = timed_iter(fill_empty_pages(pages, pdf_path), "ocr")
+        if on_page is not None:
+            pages = report_pages(pages, count_pages(pdf_path), on_page)
+        with stage("split"):
+            docs = chunk_documents(iter_page_documents(pages, metadata, sink=text_file))
+    count("chunks", len(docs))
+
+    if not docs:
+        os.remove(text_path)
+    return docs
+
+
+def report_pages(pages, pages_total: int, on_page: Callable[[int, int], None]):
+    # Pass pages through, reporting (pages done, total) as each one is extracted and OCR'd
+    on_page(0, pages_total)
+    for pages_done, page in enumerate(pages, 1):
+        yield page
+        on_page(pages_done, pages_total)
+
 
 @app.post("/upload")
 async def upload_pdf(file: UploadFile = File(...), directory: str = ""):
-    # Save uploaded file
-    upload_dir = os.path.join(UPLOAD_DIR, directory)
-    os.makedirs(upload_dir, exist_ok=True)
-    pdf_path = os.path.join(upload_dir, file.filename)
-    with open(pdf_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Extract text from PDF
-    pdf_reader = PdfReader(pdf_path)
-    extracted_text = [page.extract_text() for page in pdf_reader.pages if page.extract_text()]
-
-    for page in pdf_reader.pages:
-        text = page.extract_text()
-        if text:
-            extracted_text.append(text)
-
-
-    # Use OCR if no text was extracted
-    if not extracted_text:
-        reader = easyocr.Reader(['en'])
-        images = convert_from_path(pdf_path)
-        for image in images:
-            result = reader.readtext(np.array(image))
-            page_text = " ".join([text for (bbox, text, prob) in result])
-            if page_text.strip():
-                extracted_text.append(page_text)
-
-    if not extracted_text:
-        raise HTTPException(status_code=400, detail="No text could be extracted from the PDF")
-
-    # Save extracted text
-    extracted_dir = os.path.join(EXTRACTED_TEXT_DIR, directory)
-    os.makedirs(extracted_dir, exist_ok=True)
-    text_filename = f"{os.path.splitext(file.filename)[0]}.txt"
-    text_path = os.path.join(extracted_dir, text_filename)
-    with open(text_path, "w", encoding="utf-8") as text_file:
-        text_file.write("\n\n".join(extracted_text))
+    # Save the file and queue it; extraction, embedding and indexing run in the background
+    async with upload_limiter:
+        with stage("save"):
+            sha256, pdf_path = await run_in_threadpool(save_upload, file.file, UPLOAD_DIR)
+
+    # Already-ingested content needs no job; it is recorded as done right away
+    result = await reuse_ingested(sha256, directory, file.filename)
+    job = await run_in_threadpool(ingest_jobs.create, directory, file.filename, pdf_path, sha256, result)
+    return JSONResponse(status_code=200 if result else 202, content={"job_id": job["id"], **job})
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(ingest_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+async def reuse_ingested(sha256: str, directory: str, filename: str) -> Optional[dict]:
+    # Identical content was already extracted and embedded: only record the new source
+    cached = await run_in_threadpool(ingest_manifest.get, sha256)
+    if cached is None:
+        return None
+    attached, retired = await run_in_threadpool(ingest_manifest.add_source, sha256, directory, filename)
+    if attached:
+        answer_cache.invalidate(directory, filename)
+    await drop_retired(retired)
+    return {
+        "message": "PDF already processed; reusing stored text and embeddings",
+        "text_file": cached["text_file"],
+        "cached": True
+    }
+
+
+async def drop_retired(chunk_ids: List[str]):
+    # Content replaced by a new upload under its last name. The local stores cannot delete
+    # and keep it out of scope by hash instead (see scope_filters); IRIS drops its chunks.
+    if chunk_ids and VECTOR_BACKEND != "local":
+        await run_in_threadpool(delete_chunks, chunk_ids)
 
-    # Create documents for vector store
-    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    docs = [Document(page_content=text, metadata={"page": i, "filename": file.filename, "directory": directory}) 
-            for i, text in enumerate(extracted_text)]
-    docs = text_splitter.split_documents(docs)
+
+async def run_ingest_job(job: dict) -> dict:
+    # Every stage is safe to repeat: the text file is rewritten, embeddings come from the cache,
+    # chunk IDs are derived from the content hash and the stores skip IDs they already hold
+    with traced("ingest"):
+        return await ingest_pdf(job)
+
+
+async def ingest_pdf(job: dict) -> dict:
+    job_id, pdf_path, sha256 = job["id"], job["pdf_path"], job["sha256"]
+    directory, filename = job["directory"], job["filename"]
+
+    # Another job finished the same content first
+    result = await reuse_ingested(sha256, directory, filename)
+    if result is not None:
+        return result
+
+    # Extract text from PDF, one parse per page, and stream pages into the splitter
+    await run_in_threadpool(ingest_jobs.set_stage, job_id, "extract")
+    # Named by content like the PDF, so two versions of a file never share text, summary or bank
+    text_path = os.path.join(EXTRACTED_TEXT_DIR, f"{sha256}.txt")
+    metadata = {"filename": filename, "directory": directory, "sha256": sha256}
+    on_page = functools.partial(ingest_jobs.report_pages, job_id)
+    docs = await run_blocking(ingest_executor, extract_documents, pdf_path, text_path, metadata, on_page)
+
+    if not docs:
+        raise JobFailed("No text could be extracted from the PDF")
 
     # Initialize or update vector store
-    initialize_vector_store(docs)
+    chunk_ids = chunk_ids_for(sha256, len(docs))
+    await run_in_threadpool(ingest_jobs.set_stage, job_id, "embed")
+    with stage("embed"):
+        vectors = await embeddings.aembed_documents([doc.page_content for doc in docs])
+    await run_in_threadpool(ingest_jobs.set_stage, job_id, "store")
+    with stage("store"):
+        if job["attempts"] > 1 and VECTOR_BACKEND != "local":
+            # IRIS does not skip existing IDs; drop whatever an earlier attempt stored
+            await run_in_threadpool(delete_chunks, chunk_ids)
+        await run_in_threadpool(initialize_vector_store, docs, chunk_ids, vectors)
+        await run_in_threadpool(lexical_index.add, chunk_ids, [doc.page_content for doc in docs],
+                                [doc.metadata for doc in docs])
+        retired = await run_in_threadpool(ingest_manifest.record, sha256, text_path, chunk_ids, directory, filename)
+    answer_cache.invalidate(directory, filename)
+    await drop_retired(retired)
+    summary_builder.schedule(text_path)
+    question_bank.schedule_fill(text_path)
 
     return {
         "message": "PDF processed and stored in IRIS Vector database",
-        "text_file": text_path
+        "text_file": text_path,
+        "cached": False
     }
 
 
 @app.post("/query")
-async def query_document(query: str):
-    if vector_store is None:
-        raise HTTPException(status_code=400, detail="No documents have been uploaded yet")
-
-    docs_with_score = vector_store.similarity_search_with_score(query, k=3)
+async def query_document(query: str, directory: Optional[str] = None, filename: Optional[str] = None):
+    async with query_limiter:
+        return await answer_query(query, directory, filename)
+
+
+async def answer_query(query: str, directory: Optional[str] = None, filename: Optional[str] = None):
+    # Another worker ingested documents: its scopes are unknown here, so start over
+    await run_in_threadpool(ingest_manifest.refresh)
+    answer_cache.sync(ingest_manifest.generation)
+
+    scope = (directory, filename)
+    with stage("cache"):
+        cached = answer_cache.get_exact(scope, query)
+    if cached is not None:
+        count("cache_hits")
+        return cached
+
+    start = time.perf_counter()
+    # Keyword queries answered from BM25 skip the embedding call and the semantic cache
+    query_embedding = None
+    docs_with_score = await lexical_fast_path(query, 3, directory, filename)
+    if docs_with_score is None:
+        try:
+            with stage("embed"):
+                query_embedding = await embeddings.aembed_query(query)
+        except Exception as e:
+            # retrieve() retries and falls back to lexical results
+            print(f"Query embedding failed: {e}")
+        if query_embedding is not None:
+            with stage("cache"):
+                cached = answer_cache.get_similar(scope, query_embedding)
+            if cached is not None:
+                count("cache_hits")
+                return cached
+        docs_with_score = await retrieve(query, k=3, directory=directory, filename=filename,
+                                         query_embedding=query_embedding)
     context = "\n".join([doc.page_content for doc, _ in docs_with_score])
 
-    prompt_template = PromptTemplate(
-        input_variables=["context", "question"],
-        template="Use the following context to answer the user's question.\n\nContext: {context}\n\nQuestion: {question}\n\nAnswer:"
-    )
-    chain = LLMChain(llm=llm, prompt=prompt_template)
-    answer = chain.run(context=context, question=query)
+    with stage("llm"):
+        answer = await query_chain.arun(context=context, question=query)
 
-    return {
+    response = {
         "answer": answer.strip(),
         "context": context,
         "sources": [{"content": doc.page_content, "score": score} for doc, score in docs_with_score]
     }
+    answer_cache.put(scope, query, response, query_embedding, latency=time.perf_counter() - start)
+    return response
+
+
+async def answer_queries(queries: List[str], directory: Optional[str] = None, filename: Optional[str] = None):
+    """Yields (query, response or None on failure, cached) for each of the distinct `queries`
+    as its answer becomes ready.
+
+    Same answers as answer_query(), but the uncached questions share one embedding request
+    and one pass of vector searches, and their LLM calls run concurrently.
+    """
+    await run_in_threadpool(ingest_manifest.refresh)
+    answer_cache.sync(ingest_manifest.generation)
+
+    scope = (directory, filename)
+    start = time.perf_counter()
+    with stage("cache"):
+        cached = {query: answer_cache.get_exact(scope, query) for query in queries}
+    for query, response in cached.items():
+        if response is not None:
+            count("cache_hits")
+            yield query, response, True
+    queries = [query for query, response in cached.items() if response is None]
+
+    # Keyword questions answered from BM25 skip the embedding call, as in /query
+    fast = await asyncio.gather(*[lexical_fast_path(query, 3, directory, filename) for query in queries])
+    retrieved = {query: (docs_with_score, None) for query, docs_with_score in zip(queries, fast)
+                 if docs_with_score is not None}
+    queries = [query for query in queries if query not in retrieved]
+    query_embeddings = None
+    if queries:
+        try:
+            with stage("embed"):
+                query_embeddings = await embeddings.aembed_queries(queries)
+        except Exception as e:
+            # retrieve_many() retries and falls back to lexical results
+            print(f"Query embedding failed: {e}")
+    if query_embeddings is not None:
+        with stage("cache"):
+            similar = [answer_cache.get_similar(scope, query_embedding) for query_embedding in query_embeddings]
+        for query, response in zip(queries, similar):
+            if response is not None:
+                count("cache_hits")
+                yield query, response, True
+        query_embeddings = [e for e, response in zip(query_embeddings, similar) if response is None]
+        queries = [query for query, response in zip(queries, similar) if response is None]
+    if queries:
+        results = await retrieve_many(queries, query_embeddings, k=3, directory=directory, filename=filename)
+        for i, (query, docs_with_score) in enumerate(zip(queries, results)):
+            retrieved[query] = (docs_with_score, query_embeddings[i] if query_embeddings is not None else None)
+
+    semaphore = asyncio.Semaphore(QUERY_BATCH_LLM_CONCURRENCY)
+
+    async def answer(query: str):
+        docs_with_score, query_embedding = retrieved[query]
+        context = "\n".join([doc.page_content for doc, _ in docs_with_score])
+        try:
+            async with semaphore:
+                with stage("llm"):
+                    answer = await query_chain.arun(context=context, question=query)
+        except Exception as e:
+            print(f"Batch answer failed for {query!r}: {e}")
+            return query, None
+        response = {
+            "answer": answer.strip(),
+            "context": context,
+            "sources": [{"content": doc.page_content, "score": score} for doc, score in docs_with_score]
+        }
+        answer_cache.put(scope, query, response, query_embedding, latency=time.perf_counter() - start)
+        return query, response
+
+    tasks = [asyncio.create_task(answer(query)) for query in retrieved]
+    try:
+        for task in asyncio.as_completed(tasks):
+            query, response = await task
+            yield query, response, False
+    finally:
+        # The client went away: stop generating (and paying for) the remaining answers
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/query/batch")
+async def batch_query(body: BatchQueryRequest):
+    """Answers many questions at once, streamed as NDJSON in the order they finish.
+
+    A {"type": "chunk", "chunk": n, "content": ...} line carries each retrieved chunk once,
+    before the first answer citing it; answer lines ({"type": "answer", "index": ...}) refer to
+    chunks by number. A question that could not be answered gets an "error" line instead.
+    """
+    if not body.queries:
+        raise HTTPException(status_code=400, detail="No queries")
+    if len(body.queries) > QUERY_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {QUERY_BATCH_MAX} queries per batch")
+    # Repeated questions are answered once
+    indexes: Dict[str, List[int]] = {}
+    for index, query in enumerate(body.queries):
+        indexes.setdefault(query, []).append(index)
+
+    await query_limiter.__aenter__()
+
+    async def lines():
+        chunks: Dict[str, int] = {}
+        try:
+            async for query, response, cached in answer_queries(list(indexes), body.directory, body.filename):
+                out = []
+                if response is None:
+                    out += [{"type": "error", "index": index, "query": query,
+                             "detail": "Failed to generate an answer"} for index in indexes[query]]
+                else:
+                    sources = []
+                    for source in response["sources"]:
+                        if source["content"] not in chunks:
+                            chunks[source["content"]] = len(chunks)
+                            out.append({"type": "chunk", "chunk": chunks[source["content"]],
+                                        "content": source["content"]})
+                        sources.append({"chunk": chunks[source["content"]], "score": source["score"]})
+                    out += [{"type": "answer", "index": index, "query": query, "answer": response["answer"],
+                             "sources": sources, "cached": cached} for index in indexes[query]]
+                yield "".join(json.dumps(line) + "\n" for line in out)
+        except Exception as e:
+            print(f"Batch query error: {e}")
+            yield json.dumps({"type": "error", "detail": "Failed to answer the batch"}) + "\n"
+        finally:
+            await query_limiter.__aexit__(None, None, None)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    stats = {"answers": answer_cache.stats(), "embeddings": {"hits": embeddings.hits, "misses": embeddings.misses}}
+    if audio_cache is not None:
+        stats["audio"] = {**audio_cache.stats, "files": len(audio_cache), "bytes": audio_cache.size}
+    return stats
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query/stream")
+async def stream_query(request: Request, query: str, directory: Optional[str] = None, filename: Optional[str] = None):
+    # Server-sent events: one "sources" event, then "token" events as the LLM produces them, then "done"
+    await query_limiter.__aenter__()
+    try:
+        docs_with_score = await retrieve(query, k=3, directory=directory, filename=filename)
+    except BaseException:
+        await query_limiter.__aexit__(None, None, None)
+        raise
+    context = "\n".join([doc.page_content for doc, _ in docs_with_score])
+
+    async def events():
+        try:
+            yield sse("sources", {
+                "context": context,
+                "sources": [{"content": doc.page_content, "score": score} for doc, score in docs_with_score]
+            })
+            with stage("llm"):
+                async for chunk in llm.astream(query_prompt.format(context=context, question=query)):
+                    # Stop generating (and paying for tokens) once the listener has gone
+                    if await request.is_disconnected():
+                        return
+                    yield sse("token", {"text": chunk.content})
+            yield sse("done", {})
+        except Exception as e:
+            print(f"Streaming error: {e}")
+            yield sse("error", {"detail": "Failed to generate an answer"})
+        finally:
+            await query_limiter.__aexit__(None, None, None)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.post("/qa")
-async def get_qa(query: str):
-    if vector_store is None:
-        raise HTTPException(status_code=400, detail="No documents have been uploaded yet")
+async def get_qa(query: str, directory: Optional[str] = None, filename: Optional[str] = None):
+    async with generation_limiter:
+        return await generate_qa(query, directory, filename)
+
 
-    docs_with_score = vector_store.similarity_search_with_score(query)
+async def generate_qa(query: str, directory: Optional[str] = None, filename: Optional[str] = None):
+    docs_with_score = await retrieve(query, directory=directory, filename=filename)
     context = "\n".join([doc.page_content for doc, _ in docs_with_score])
 
-    prompt_template = PromptTemplate(
-        input_variables=["context"],
-        template="Generate 3 open-ended questions based on the following text. For each question, also provide a concise answer. Format your response as JSON:\n\n{context}"
-    )
-    chain = LLMChain(llm=llm, prompt=prompt_template)
-    questions_raw = chain.run(context=context)
+    with stage("llm"):
+        questions_raw = await qa_chain.arun(context=context)
     
     try:
         questions_list = json.loads(questions_raw)
@@ -188,29 +812,9 @@ async def get_qa(query: str):
         raise HTTPException(status_code=500, detail="Failed to parse questions output")
 
 # Helper function to generate multiple-choice questions
-def create_multiple_choice_questions(context: str, num_questions: int) -> List[MultipleChoiceQuestion]:
-    prompt_template = PromptTemplate(
-        input_variables=["context", "num_questions"],
-        template="""Create {num_questions} multiple-choice questions with 4 options each based on the following text. Give options in only one word. Format your response as a JSON list of questions:
-
-        [
-            {{
-                "question": "Your question here",
-                "choices": {{
-                    "A": "First option",
-                    "B": "Second option",
-                    "C": "Third option",
-                    "D": "Fourth option"
-                }},
-                "correct_answer": "A"
-            }},
-            // More questions...
-        ]
-
-        Text: {context}"""
-    )
-    chain = LLMChain(llm=llm, prompt=prompt_template)
-    mcq_raw = chain.run(context=context, num_questions=num_questions)
+async def create_multiple_choice_questions(context: str, num_questions: int) -> List[MultipleChoiceQuestion]:
+    with stage("llm"):
+        mcq_raw = await mcq_chain.arun(context=context, num_questions=num_questions)
     
     try:
         mcq_list = json.loads(mcq_raw)
@@ -218,36 +822,103 @@ def create_multiple_choice_questions(context: str, num_questions: int) -> List[M
     except json.JSONDecodeError:
         raise HTTPException(status_code=500, detail="Failed to parse MCQ output")
 
-def get_context(query: str) -> str:
-    if vector_store is None:
-        raise HTTPException(status_code=400, detail="No documents have been uploaded yet")
-    
-    docs_with_score = vector_store.similarity_search_with_score(query)
+async def get_context(query: str, directory: Optional[str] = None, filename: Optional[str] = None) -> str:
+    docs_with_score = await retrieve(query, directory=directory, filename=filename)
     return "\n".join([doc.page_content for doc, _ in docs_with_score])
 
 
+async def generate_bank_questions(context: str, num_questions: int) -> List[dict]:
+    return [mcq.model_dump() for mcq in await create_multiple_choice_questions(context, num_questions)]
+
+
 @app.post("/mcq", response_model=MCQResponse)
-async def get_mcq(query: str = "create MCQs", num_questions: int = 1):
-    context = get_context(query)
-    mcqs = create_multiple_choice_questions(context, num_questions)
+async def get_mcq(query: str = "create MCQs", num_questions: int = 1,
+                  directory: Optional[str] = None, filename: Optional[str] = None,
+                  session_id: Optional[str] = None):
+    # Serve from the pregenerated banks of the documents in scope, without repeats per session
+    with stage("bank"):
+        text_files = await run_in_threadpool(ingest_manifest.text_files_for, directory, filename)
+        mcqs = [
+            MultipleChoiceQuestion(question=q["question"], choices=q["choices"], correct_answer=q["correct_answer"])
+            for q in await question_bank.draw(text_files, session_id, num_questions)
+        ]
+    count("bank_questions", len(mcqs))
+
+    # Banks still filling (or used up by this session): generate the shortfall live
+    if len(mcqs) < num_questions:
+        async with generation_limiter:
+            context = await get_context(query, directory, filename)
+            mcqs += await create_multiple_choice_questions(context, num_questions - len(mcqs))
     return MCQResponse(multiple_choice_questions=mcqs)
 
 
 @app.get("/summary")
-async def summary_document():
-    if vector_store is None:
-        raise HTTPException(status_code=400, detail="No documents have been uploaded yet")
-
-    docs_with_score = vector_store.similarity_search_with_score("Create a Summary of the document")
+async def summary_document(directory: Optional[str] = None, filename: Optional[str] = None):
+    if filename is not None:
+        return await stored_summary(directory, filename)
+    async with generation_limiter:
+        return await summarize(directory, filename)
+
+
+async def load_built_summary(directory: Optional[str], filename: str):
+    # The stored summary, or a response saying it is still being built or its build failed
+    with stage("load"):
+        text_file = await run_in_threadpool(ingest_manifest.text_file_for, directory, filename)
+        if text_file is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        summary = await run_in_threadpool(load_summary, text_file)
+    if summary is None or retry_due(summary):
+        summary_builder.schedule(text_file)
+        return JSONResponse(status_code=202, content={"status": "pending"})
+    if summary_failed(summary):
+        return JSONResponse(status_code=500, content={"status": "failed", "error": summary["error"]})
+    return summary
+
+
+async def stored_summary(directory: Optional[str], filename: str):
+    # Whole-document summary precomputed after upload; no LLM call on the request path
+    summary = await load_built_summary(directory, filename)
+    if isinstance(summary, Response):
+        return summary
+    return {"status": "ready", **summary}
+
+
+async def narrate_summary(text_path: str, summary: dict):
+    # Synthesized in the background after ingest, so the first playback is a disk read
+    if tts is None:
+        return
+    try:
+        await run_in_threadpool(audio_cache.get_or_synthesize, summary["summary"], tts.voice, tts.format,
+                                tts.synthesize)
+    except Exception as e:
+        print(f"Summary narration failed for {text_path}: {e}")
+
+
+@app.get("/summary/audio")
+async def summary_audio(request: Request, filename: str, directory: Optional[str] = None):
+    if tts is None:
+        raise HTTPException(status_code=404, detail="Narration is not configured")
+    summary = await load_built_summary(directory, filename)
+    if isinstance(summary, Response):
+        return summary
+    # The audio is addressed by its text, so a rebuilt summary gets a new ETag
+    etag = f'"{audio_key(summary["summary"], tts.voice, tts.format)}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    with stage("tts"):
+        audio = await run_in_threadpool(audio_cache.get_or_synthesize, summary["summary"], tts.voice,
+                                        tts.format, tts.synthesize)
+    if not audio:
+        raise HTTPException(status_code=502, detail="Could not synthesize speech")
+    return Response(content=audio, media_type=MEDIA_TYPES[tts.format], headers={"ETag": etag})
+
+
+async def summarize(directory: Optional[str] = None, filename: Optional[str] = None):
+    docs_with_score = await retrieve("Create a Summary of the document", directory=directory, filename=filename)
     context = "\n".join([doc.page_content for doc, _ in docs_with_score])
 
-    prompt_template = PromptTemplate(
-        input_variables=["context"],
-        template="Provide a comprehensive summary of the following text:\n\n{context}"
-    )
-    
-    chain = LLMChain(llm=llm, prompt=prompt_template)
-    summary = chain.run(context=context)
+    with stage("llm"):
+        summary = await summary_chain.arun(context=context)
 
     return {
         "summary": summary.strip(),
@@ -0,0 +1,282 @@
+# Per-request stage timings and counters, exported in the Prometheus text format
+#
+# Code on the request path wraps its work in `stage("embed")` / `timed_iter(pages, "parse")`
+# and reports sizes with `count("chunks", n)`. Stage times are exclusive: time spent in a
+# nested stage is not counted again in the enclosing one.
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from tokens import count_tokens
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+# Clients send `X-Profile: 1` to get their request's stage breakdown back; PROFILE_HEADER=0 disables it
+PROFILE_HEADER = "x-profile"
+PROFILE_HEADER_ENABLED = os.getenv("PROFILE_HEADER", "1") == "1"
+# Work that outlives its request (summaries, question banks) is reported under this endpoint
+BACKGROUND = "background"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(self._values.items())]
+        return "\n".join(lines)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', repr(float(bound))),))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {counts[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {counts[-1]}")
+        return "\n".join(lines)
+
+
+request_duration = Histogram("request_duration_seconds", "End-to-end request latency")
+stage_duration = Histogram("stage_duration_seconds", "Time spent per request stage, excluding nested stages")
+request_items = Histogram("request_items", "Items (pages, chunks, tokens) handled per request", SIZE_BUCKETS)
+items_total = Counter("items_total", "Items (pages, chunks, tokens) handled")
+REGISTRY = [request_duration, stage_duration, request_items, items_total]
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class RequestTrace:
+    """Stage timings and counts of one request; shared by the threads working on it."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_count(self, name: str, amount: int):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def finish(self, status: int):
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+        request_duration.observe(time.perf_counter() - self.started, endpoint=self.endpoint, status=str(status))
+        for name, seconds in self.stages.items():
+            stage_duration.observe(seconds, endpoint=self.endpoint, stage=name)
+        for name, amount in self.counts.items():
+            request_items.observe(amount, endpoint=self.endpoint, item=name)
+
+    def profile(self) -> dict:
+        with self._lock:
+            return {
+                "endpoint": self.endpoint,
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+                "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+                "counts": dict(self.counts),
+            }
+
+    def server_timing(self) -> str:
+        with self._lock:
+            return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items())
+
+
+_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("request_trace", default=None)
+# Open stages of the current thread/task, innermost last: [name, seconds spent in nested stages]
+_open_stages: contextvars.ContextVar[tuple] = contextvars.ContextVar("open_stages", default=())
+
+
+def current_trace() -> Optional[RequestTrace]:
+    trace = _trace.get()
+    # Background tasks inherit the context of the request that started them
+    return None if trace is None or trace.finished else trace
+
+
+def _record_stage(name: str, seconds: float):
+    trace = current_trace()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+    else:
+        stage_duration.observe(seconds, endpoint=BACKGROUND, stage=name)
+
+
+def count(name: str, amount: int = 1):
+    trace = current_trace()
+    items_total.inc(amount, endpoint=trace.endpoint if trace else BACKGROUND, item=name)
+    if trace is not None:
+        trace.add_count(name, amount)
+
+
+@contextmanager
+def stage(name: str):
+    entry = [name, 0.0]
+    parents = _open_stages.get()
+    token = _open_stages.set(parents + (entry,))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _open_stages.reset(token)
+        if parents:
+            parents[-1][1] += elapsed
+        # Nested stages running concurrently can add up to more than the wall time
+        _record_stage(name, max(0.0, elapsed - entry[1]))
+
+
+@contextmanager
+def traced(endpoint: str):
+    """Record work done outside a request (e.g. a background job) like an instrumented request."""
+    trace = RequestTrace(endpoint)
+    token = _trace.set(trace)
+    status = 500
+    try:
+        yield trace
+        status = 200
+    finally:
+        trace.finish(status)
+        _trace.reset(token)
+
+
+def timed_iter(items: Iterable, name: str, counter: Optional[str] = None) -> Iterator:
+    """Attribute the time spent producing each item of a lazy pipeline step to `name`."""
+    iterator = iter(items)
+    produced = 0
+    try:
+        while True:
+            with stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            produced += 1
+            yield item
+    finally:
+        if counter is not None:
+            count(counter, produced)
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Counts prompt and completion tokens of every LLM call against the current request."""
+
+    # Run in the caller's context so the request trace is visible
+    run_inline = True
+
+    def __init__(self):
+        self._prompt_tokens: Dict[object, int] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._prompt_tokens[run_id] = sum(count_tokens(str(m.content)) for batch in messages for m in batch)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._prompt_tokens[run_id] = sum(count_tokens(prompt) for prompt in prompts)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        estimated_prompt = self._prompt_tokens.pop(run_id, 0)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        completion = usage.get("completion_tokens")
+        if completion is None:
+            completion = sum(count_tokens(generation.text) for generations in response.generations
+                             for generation in generations)
+        count("prompt_tokens", usage.get("prompt_tokens", estimated_prompt))
+        count("completion_tokens", completion)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._prompt_tokens.pop(run_id, None)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: one RequestTrace per instrumented request, optional profile headers."""
+
+    def __init__(self, app, endpoints: Dict[str, str]):
+        self.app = app
+        # path -> endpoint label
+        self.endpoints = endpoints
+
+    async def __call__(self, scope, receive, send):
+        endpoint = self.endpoints.get(scope.get("path")) if scope["type"] == "http" else None
+        if endpoint is None:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(endpoint)
+        token = _trace.set(trace)
+        headers = dict(scope.get("headers") or [])
+        profile = PROFILE_HEADER_ENABLED and headers.get(PROFILE_HEADER.encode()) not in (None, b"", b"0")
+        status = 500
+
+        async def send_with_profile(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile:
+                    # Streaming responses only carry the stages finished before the first byte
+                    message = {**message, "headers": list(message.get("headers", [])) + [
+                        (b"server-timing", trace.server_timing().encode()),
+                        (b"x-profile", json.dumps(trace.profile()).encode()),
+                    ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            trace.finish(status)
+            _trace.reset(token)
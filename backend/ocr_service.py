@@ -0,0 +1,103 @@
+# Long-lived OCR engine with windowed page rasterization
+import os
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "en").split(",")
+# Pages rasterized at once; bounds peak memory for large scans
+OCR_WINDOW = int(os.getenv("OCR_WINDOW", "4"))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+# "fake" swaps in providers.FakeOCRService for offline benchmarks
+OCR_PROVIDER = os.getenv("OCR_PROVIDER", "easyocr")
+
+
+class OCRService:
+    """Loads the EasyOCR detector/recognizer once and reuses it for every request."""
+
+    def __init__(self, languages: Optional[List[str]] = None, window: int = OCR_WINDOW, dpi: int = OCR_DPI):
+        self.languages = languages or OCR_LANGUAGES
+        self.window = max(1, window)
+        self.dpi = dpi
+        self._reader = None
+        self._load_lock = threading.Lock()
+        # easyocr.Reader is not safe to call from several threads at once
+        self._ocr_lock = threading.Lock()
+
+    @property
+    def reader(self) -> "easyocr.Reader":
+        # easyocr pulls in torch; only pay for it once a scanned page shows up (or at warmup)
+        if self._reader is None:
+            with self._load_lock:
+                if self._reader is None:
+                    import easyocr
+                    self._reader = easyocr.Reader(self.languages)
+        return self._reader
+
+    def ocr_image(self, image) -> str:
+        with self._ocr_lock:
+            result = self.reader.readtext(np.array(image))
+        return " ".join([text for (bbox, text, prob) in result])
+
+    def _windows(self, page_numbers: Iterable[int]) -> Iterator[Tuple[int, int]]:
+        # Group sorted page numbers into contiguous runs of at most `window` pages
+        first = last = None
+        for page_number in sorted(page_numbers):
+            if first is not None and page_number == last + 1 and page_number - first < self.window:
+                last = page_number
+                continue
+            if first is not None:
+                yield first, last
+            first = last = page_number
+        if first is not None:
+            yield first, last
+
+    def ocr_pages(self, pdf_path: str, page_numbers: Iterable[int]) -> Iterator[Tuple[int, str]]:
+        """OCR the given 0-based pages, rasterizing one window at a time."""
+        from pdf2image import convert_from_path
+
+        for first, last in self._windows(page_numbers):
+            images = convert_from_path(pdf_path, dpi=self.dpi, first_page=first + 1, last_page=last + 1)
+            for page_number, image in zip(range(first, last + 1), images):
+                yield page_number, self.ocr_image(image)
+            del images
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_ocr_service() -> OCRService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None and OCR_PROVIDER == "fake":
+                from providers import FakeOCRService
+                _service = FakeOCRService()
+            elif _service is None:
+                _service = OCRService()
+    return _service
+
+
+def fill_empty_pages(pages: Iterable[Tuple[int, str]], pdf_path: str,
+                     service: Optional[OCRService] = None) -> Iterator[Tuple[int, str]]:
+    """Pass extracted pages through, OCR'ing only the pages whose text layer is empty.
+
+    Page order is preserved and empty pages are OCR'd in windows as they are met.
+    """
+    service = service or get_ocr_service()
+    pending = []
+    for page_number, text in pages:
+        if text and text.strip():
+            if pending:
+                yield from service.ocr_pages(pdf_path, pending)
+                pending = []
+            yield page_number, text
+            continue
+        pending.append(page_number)
+        if len(pending) >= service.window:
+            yield from service.ocr_pages(pdf_path, pending)
+            pending = []
+    if pending:
+        yield from service.ocr_pages(pdf_path, pending)
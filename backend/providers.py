@@ -0,0 +1,300 @@
+# LLM, embedding and OCR providers, selected by environment
+#
+#   LLM_PROVIDER=openai|fake  EMBEDDING_PROVIDER=openai|fake  OCR_PROVIDER=easyocr|fake
+#   TTS_PROVIDER=azure|fake|none (azure needs AZURE_SPEECH_KEY and AZURE_SPEECH_REGION)
+#
+# OpenAI and Azure Speech are called through the repository's shared pooled client (shared/llm_client.py).
+# The fake providers are deterministic and need no network, so benchmarks and local
+# runs exercise the real request paths without OpenAI or EasyOCR.
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, AsyncIterator, Iterable, Iterator, List, Optional, Tuple, Union
+from xml.sax.saxutils import escape
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel, SimpleChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import SecretStr
+
+# shared/ lives at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.audio_cache import wav_bytes  # noqa: E402
+from shared.llm_client import get_client, sse_data  # noqa: E402
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+OCR_PROVIDER = os.getenv("OCR_PROVIDER", "easyocr")
+TTS_PROVIDER = os.getenv("TTS_PROVIDER", "azure")
+TTS_VOICE = os.getenv("TTS_VOICE", "en-US-JennyNeural")
+
+# Simulated provider latency in seconds, so concurrency effects show up in benchmarks
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+FAKE_EMBEDDING_LATENCY = float(os.getenv("FAKE_EMBEDDING_LATENCY", "0"))
+FAKE_OCR_LATENCY = float(os.getenv("FAKE_OCR_LATENCY", "0"))
+FAKE_TTS_LATENCY = float(os.getenv("FAKE_TTS_LATENCY", "0"))
+# Words in a fake free-text answer
+FAKE_ANSWER_WORDS = int(os.getenv("FAKE_ANSWER_WORDS", "60"))
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+
+WORD = re.compile(r"[A-Za-z][A-Za-z'-]+")
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+class FakeChatModel(SimpleChatModel):
+    """Answers from the words of its prompt; emits valid JSON for the quiz prompts."""
+
+    latency: float = FAKE_LLM_LATENCY
+    answer_words: int = FAKE_ANSWER_WORDS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _respond(self, prompt: str) -> str:
+        words = WORD.findall(prompt) or ["nothing"]
+        seed = _digest(prompt)
+
+        def word(i: int) -> str:
+            return words[(seed + i * 7919) % len(words)]
+
+        match = re.search(r"Create (\d+) multiple-choice", prompt)
+        if match:
+            return json.dumps([
+                {
+                    "question": f"Which term best matches {word(5 * i)} {word(5 * i + 1)} (#{seed % 9973}-{i})?",
+                    "choices": {letter: word(5 * i + n + 2) for n, letter in enumerate("ABCD")},
+                    "correct_answer": "ABCD"[(seed + i) % 4],
+                }
+                for i in range(int(match.group(1)))
+            ])
+        if "open-ended questions" in prompt:
+            return json.dumps([
+                {"question": f"What does the text say about {word(2 * i)}?",
+                 "answer": f"It relates {word(2 * i)} to {word(2 * i + 1)}."}
+                for i in range(3)
+            ])
+        return " ".join(word(i) for i in range(self.answer_words))
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+              run_manager=None, **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond("\n".join(str(m.content) for m in messages))
+
+    async def _acall_text(self, messages: List[BaseMessage]) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond("\n".join(str(m.content) for m in messages))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = await self._acall_text(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        # Time to first token is the configured latency; the rest streams word by word
+        text = await self._acall_text(messages)
+        for token in re.findall(r"\S+\s*", text):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class FakeEmbeddings(Embeddings):
+    """Signed feature hashing of the words of a text: similar texts get similar vectors."""
+
+    def __init__(self, dimension: int, latency: float = FAKE_EMBEDDING_LATENCY):
+        self.dimension = dimension
+        self.latency = latency
+        self.model = f"fake-hashing-{dimension}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in WORD.findall(text.lower()) or [text]:
+            digest = _digest(token)
+            vector[digest % self.dimension] += 1.0 if (digest >> 32) & 1 else -1.0
+        vector /= np.linalg.norm(vector) or 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeOCRService:
+    """Stands in for OCRService without rasterizing: returns fixed text per page."""
+
+    window = 4
+
+    def __init__(self, latency: float = FAKE_OCR_LATENCY):
+        self.latency = latency
+
+    @property
+    def reader(self):
+        return None
+
+    def ocr_pages(self, pdf_path: str, page_numbers: Iterable[int]) -> Iterator[Tuple[int, str]]:
+        name = os.path.basename(pdf_path)
+        for page_number in page_numbers:
+            if self.latency:
+                time.sleep(self.latency)
+            yield page_number, f"Scanned page {page_number + 1} of {name}. " * 20
+
+
+class FakeTTS:
+    """Silent WAV audio, 10 ms per character of text."""
+
+    voice = "fake"
+    format = "wav"
+
+    def __init__(self, latency: float = FAKE_TTS_LATENCY):
+        self.latency = latency
+
+    def synthesize(self, text: str) -> bytes:
+        if self.latency:
+            time.sleep(self.latency)
+        return wav_bytes(b"\0\0" * 160 * len(text))
+
+
+def _openai_headers(api_key: Union[SecretStr, str, None]) -> dict:
+    if isinstance(api_key, SecretStr):
+        api_key = api_key.get_secret_value()
+    return {"Authorization": f"Bearer {api_key}"}
+
+
+class OpenAIChatModel(BaseChatModel):
+    """OpenAI chat completions over the shared pooled client (retries, in-flight cap, coalescing)."""
+
+    model_name: str = "gpt-3.5-turbo"
+    temperature: float = 0
+    # SecretStr like ChatOpenAI's, so the key stays out of repr(), dumps and traces
+    openai_api_key: Optional[SecretStr] = None
+    base_url: str = OPENAI_BASE_URL
+
+    @property
+    def _llm_type(self) -> str:
+        return "openai-chat"
+
+    def _request(self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any):
+        from langchain_community.adapters.openai import convert_message_to_dict
+        payload = {"model": self.model_name, "temperature": self.temperature,
+                   "messages": [convert_message_to_dict(m) for m in messages], **kwargs}
+        if stop:
+            payload["stop"] = stop
+        return f"{self.base_url}/chat/completions", payload, _openai_headers(self.openai_api_key)
+
+    def _result(self, data: dict) -> ChatResult:
+        generations = [ChatGeneration(message=AIMessage(content=choice["message"].get("content") or ""))
+                       for choice in data["choices"]]
+        return ChatResult(generations=generations,
+                          llm_output={"token_usage": data.get("usage") or {}, "model_name": self.model_name})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return self._result(get_client().post_json(*self._request(messages, stop, **kwargs)))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return self._result(await get_client().apost_json(*self._request(messages, stop, **kwargs)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        url, payload, headers = self._request(messages, stop, **kwargs)
+        async for line in get_client().astream_lines(url, {**payload, "stream": True}, headers):
+            for data in sse_data([line]):
+                choices = data.get("choices") or []
+                content = (choices[0].get("delta") or {}).get("content") if choices else None
+                if content:
+                    if run_manager:
+                        await run_manager.on_llm_new_token(content)
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=content))
+
+
+class OpenAIEmbeddingModel(Embeddings):
+    """OpenAI embeddings over the shared pooled client."""
+
+    def __init__(self, model: str = "text-embedding-ada-002", openai_api_key: Optional[str] = None,
+                 base_url: str = OPENAI_BASE_URL):
+        # `model` also keys the embedding cache
+        self.model = model
+        self.url = f"{base_url}/embeddings"
+        self.headers = _openai_headers(openai_api_key)
+
+    @staticmethod
+    def _vectors(data: dict) -> List[List[float]]:
+        return [item["embedding"] for item in sorted(data["data"], key=lambda item: item["index"])]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._vectors(get_client().post_json(self.url, {"model": self.model, "input": texts}, self.headers))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._vectors(await get_client().apost_json(self.url, {"model": self.model, "input": texts},
+                                                           self.headers))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class AzureTTS:
+    """Azure Speech text-to-speech REST API over the shared pooled client; MP3 keeps narrations small."""
+
+    format = "mp3"
+
+    def __init__(self, api_key: str, region: str, voice: str = TTS_VOICE):
+        # `voice` also keys the audio cache
+        self.voice = f"azure:{voice}"
+        self.voice_name = voice
+        self.url = f"https://{region}.tts.speech.microsoft.com/cognitiveservices/v1"
+        self.headers = {"Ocp-Apim-Subscription-Key": api_key, "Content-Type": "application/ssml+xml",
+                        "X-Microsoft-OutputFormat": "audio-24khz-48kbitrate-mono-mp3"}
+
+    def synthesize(self, text: str) -> bytes:
+        ssml = (f"<speak version='1.0' xml:lang='en-US'><voice name='{self.voice_name}'>"
+                f"{escape(text)}</voice></speak>")
+        return get_client().post_bytes(self.url, ssml.encode("utf-8"), self.headers)
+
+
+def make_llm(callbacks: Optional[list] = None):
+    if LLM_PROVIDER == "fake":
+        return FakeChatModel(callbacks=callbacks)
+    return OpenAIChatModel(
+        temperature=0,
+        model_name="gpt-3.5-turbo",
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        callbacks=callbacks
+    )
+
+
+def make_embeddings(dimension: int) -> Embeddings:
+    if EMBEDDING_PROVIDER == "fake":
+        return FakeEmbeddings(dimension)
+    return OpenAIEmbeddingModel(openai_api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def make_tts():
+    # None when no speech service is configured; documents are then not narrated
+    if TTS_PROVIDER == "fake":
+        return FakeTTS()
+    api_key = os.getenv("AZURE_SPEECH_KEY")
+    if TTS_PROVIDER != "azure" or not api_key:
+        return None
+    return AzureTTS(api_key, os.getenv("AZURE_SPEECH_REGION", "eastus"))
@@ -0,0 +1,171 @@
+# Per-document MCQ bank: generated in batches after ingest, drawn from without repeats per session
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import time
+from contextlib import closing
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from summaries import read_chunks
+
+# Questions requested from the LLM per chunk
+BANK_BATCH_SIZE = int(os.getenv("QUESTION_BANK_BATCH_SIZE", "5"))
+# Refill once a session has fewer unseen questions than this
+BANK_LOW_WATERMARK = int(os.getenv("QUESTION_BANK_LOW_WATERMARK", "20"))
+# Chunks processed per refill
+BANK_REFILL_CHUNKS = int(os.getenv("QUESTION_BANK_REFILL_CHUNKS", "4"))
+BANK_MAX_QUESTIONS = int(os.getenv("QUESTION_BANK_MAX_QUESTIONS", "500"))
+# Questions served to each session, shared by every worker process
+QUESTION_SERVED_DB = os.getenv("QUESTION_SERVED_DB", "served_questions.sqlite3")
+# A question served this long ago may be served to the same session again
+SESSION_TTL = 6 * 3600
+
+SERVED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS served (
+    session_id TEXT NOT NULL,
+    text_path TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    served_at REAL NOT NULL,
+    PRIMARY KEY (session_id, text_path, question_id)
+);
+CREATE INDEX IF NOT EXISTS served_expiry ON served (served_at);
+"""
+
+
+def bank_path(text_path: str) -> str:
+    return f"{os.path.splitext(text_path)[0]}.questions.json"
+
+
+def question_id(question: dict) -> str:
+    return hashlib.sha256(question["question"].strip().lower().encode("utf-8")).hexdigest()[:16]
+
+
+class QuestionBank:
+    """Loads, fills and serves the question banks of every document in this worker.
+
+    What each session was served is kept in SQLite, so a session sees no repeats whichever
+    worker handles its requests.
+    """
+
+    def __init__(self, generate: Callable[[str, int], Awaitable[List[dict]]],
+                 served_path: str = QUESTION_SERVED_DB):
+        # generate(context, num_questions) -> list of {"question", "choices", "correct_answer"}
+        self.generate = generate
+        self.served_path = served_path
+        self._banks: Dict[str, dict] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._filling: Dict[str, asyncio.Task] = {}
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SERVED_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call, as in ingest_jobs; safe from any thread or process
+        return sqlite3.connect(self.served_path, timeout=30, isolation_level=None)
+
+    def _load(self, text_path: str) -> dict:
+        # Reload when another worker's fill rewrote the file
+        path = bank_path(text_path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return self._banks.setdefault(text_path, {"questions": [], "next_chunk": 0, "passes": 0})
+        if self._mtimes.get(text_path) != mtime:
+            with open(path, encoding="utf-8") as f:
+                self._banks[text_path] = json.load(f)
+            self._mtimes[text_path] = mtime
+        return self._banks[text_path]
+
+    def _save(self, text_path: str, bank: dict):
+        path = bank_path(text_path)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(bank, f, indent=2)
+        os.replace(tmp_path, path)
+        self._mtimes[text_path] = os.stat(path).st_mtime_ns
+
+    def schedule_fill(self, text_path: str, max_chunks: Optional[int] = None) -> asyncio.Task:
+        """Start (or join) the background fill for a document; None fills every chunk once."""
+        task = self._filling.get(text_path)
+        if task is None:
+            task = asyncio.create_task(self._fill(text_path, max_chunks))
+            self._filling[text_path] = task
+            task.add_done_callback(lambda _: self._filling.pop(text_path, None))
+        return task
+
+    async def _fill(self, text_path: str, max_chunks: Optional[int]):
+        loop = asyncio.get_running_loop()
+        try:
+            chunks = await loop.run_in_executor(None, read_chunks, text_path)
+            bank = await loop.run_in_executor(None, self._load, text_path)
+            if not chunks or len(bank["questions"]) >= BANK_MAX_QUESTIONS:
+                return
+            known = {question_id(q) for q in bank["questions"]}
+            for _ in range(len(chunks) if max_chunks is None else max_chunks):
+                index = bank["next_chunk"] % len(chunks)
+                try:
+                    questions = await self.generate(chunks[index], BANK_BATCH_SIZE)
+                except Exception as e:
+                    print(f"Question generation failed for {text_path} chunk {index}: {e}")
+                    questions = []
+                for question in questions:
+                    qid = question_id(question)
+                    if qid not in known:
+                        known.add(qid)
+                        bank["questions"].append({"id": qid, **question})
+                bank["next_chunk"] = index + 1
+                if bank["next_chunk"] >= len(chunks):
+                    bank["next_chunk"] = 0
+                    bank["passes"] += 1
+                # Persist after every batch so a restart keeps what was generated
+                await loop.run_in_executor(None, self._save, text_path, bank)
+                if len(bank["questions"]) >= BANK_MAX_QUESTIONS:
+                    break
+        except Exception as e:
+            print(f"Question bank fill failed for {text_path}: {e}")
+
+    def _served(self, session_id: str, text_paths: List[str]) -> Dict[str, Set[str]]:
+        # Question ids served to the session within SESSION_TTL, per document
+        served = {text_path: set() for text_path in text_paths}
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT text_path, question_id FROM served WHERE session_id = ? AND served_at >= ?",
+                                (session_id, time.time() - SESSION_TTL))
+            for text_path, qid in rows:
+                if text_path in served:
+                    served[text_path].add(qid)
+        return served
+
+    def _mark_served(self, session_id: str, picks: List[tuple]):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT OR REPLACE INTO served (session_id, text_path, question_id, served_at)"
+                             " VALUES (?, ?, ?, ?)",
+                             [(session_id, text_path, question["id"], now) for text_path, question in picks])
+            conn.execute("DELETE FROM served WHERE served_at < ?", (now - SESSION_TTL,))
+            conn.execute("COMMIT")
+
+    def _load_for_draw(self, text_paths: List[str], session_id: Optional[str]):
+        banks = [self._load(text_path) for text_path in text_paths]
+        served = self._served(session_id, text_paths) if session_id else {}
+        return banks, served
+
+    async def draw(self, text_paths: List[str], session_id: Optional[str], count: int) -> List[dict]:
+        """Up to `count` random questions from the given documents not yet served to the session."""
+        # Bank files and the served table are read off the loop; refills must be scheduled on it
+        loop = asyncio.get_running_loop()
+        banks, served = await loop.run_in_executor(None, self._load_for_draw, text_paths, session_id)
+        available = []
+        for text_path, bank in zip(text_paths, banks):
+            unseen = [q for q in bank["questions"] if q["id"] not in served.get(text_path, ())]
+            available.extend((text_path, q) for q in unseen)
+            if len(unseen) < BANK_LOW_WATERMARK + count and len(bank["questions"]) < BANK_MAX_QUESTIONS:
+                self.schedule_fill(text_path, BANK_REFILL_CHUNKS)
+
+        picks = random.sample(available, min(count, len(available)))
+        if session_id and picks:
+            await loop.run_in_executor(None, self._mark_served, session_id, picks)
+        return [question for _, question in picks]
@@ -0,0 +1,146 @@
+# Map-reduce document summaries built once after ingest and stored next to the extracted text
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from langchain.chains import LLMChain
+from langchain.prompts import PromptTemplate
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Characters of extracted text per map step; larger than retrieval chunks to keep LLM calls few
+SUMMARY_CHUNK_SIZE = int(os.getenv("SUMMARY_CHUNK_SIZE", "4000"))
+# Chunk summaries folded into one section summary
+SECTION_SIZE = int(os.getenv("SUMMARY_SECTION_SIZE", "8"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+# Seconds before a failed build is retried on the next request for it
+RETRY_AFTER_FAILURE = 60
+
+chunk_prompt = PromptTemplate(
+    input_variables=["text"],
+    template="Summarize the key points of the following passage in a few sentences:\n\n{text}"
+)
+section_prompt = PromptTemplate(
+    input_variables=["text"],
+    template="Combine these consecutive passage summaries into one coherent section summary:\n\n{text}"
+)
+document_prompt = PromptTemplate(
+    input_variables=["text"],
+    template="Provide a comprehensive summary of the document described by these section summaries:\n\n{text}"
+)
+
+
+def summary_path(text_path: str) -> str:
+    return f"{os.path.splitext(text_path)[0]}.summary.json"
+
+
+def load_summary(text_path: str) -> Optional[dict]:
+    path = summary_path(text_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_summary(text_path: str, summary: dict):
+    path = summary_path(text_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def failed(summary: dict) -> bool:
+    # Stored in place of the summary when a build fails, so every worker sees the failure
+    return summary.get("status") == "failed"
+
+
+def retry_due(summary: dict) -> bool:
+    return failed(summary) and time.time() - summary["failed_at"] >= RETRY_AFTER_FAILURE
+
+
+def read_chunks(text_path: str) -> List[str]:
+    with open(text_path, encoding="utf-8") as f:
+        text = f.read()
+    # Falls back from paragraphs to lines to words, so no chunk ends up over the size
+    splitter = RecursiveCharacterTextSplitter(chunk_size=SUMMARY_CHUNK_SIZE, chunk_overlap=0)
+    return splitter.split_text(text)
+
+
+def build_chains(llm) -> Dict[str, LLMChain]:
+    return {
+        "chunk": LLMChain(llm=llm, prompt=chunk_prompt),
+        "section": LLMChain(llm=llm, prompt=section_prompt),
+        "document": LLMChain(llm=llm, prompt=document_prompt),
+    }
+
+
+async def build_summary(llm, chunks: List[str], concurrency: int = SUMMARY_CONCURRENCY,
+                        chains: Optional[Dict[str, LLMChain]] = None) -> dict:
+    """Chunk summaries -> section summaries -> document summary."""
+    semaphore = asyncio.Semaphore(concurrency)
+    chains = chains or build_chains(llm)
+
+    async def run(step: str, text: str) -> str:
+        async with semaphore:
+            return (await chains[step].arun(text=text)).strip()
+
+    async def reduce_section(section: List[str]) -> str:
+        if len(section) == 1:
+            return section[0]
+        return await run("section", "\n\n".join(section))
+
+    chunk_summaries = await asyncio.gather(*[run("chunk", chunk) for chunk in chunks])
+    sections = [chunk_summaries[i:i + SECTION_SIZE] for i in range(0, len(chunk_summaries), SECTION_SIZE)]
+    section_summaries = await asyncio.gather(*[reduce_section(section) for section in sections])
+    document_summary = await run("document", "\n\n".join(section_summaries))
+    return {
+        "summary": document_summary,
+        "sections": list(section_summaries),
+        "chunk_count": len(chunks),
+    }
+
+
+class SummaryBuilder:
+    """Runs at most one background build per document in this worker.
+
+    `on_built(text_path, summary)` runs after each summary is stored. A failed build stores
+    {"status": "failed", "error", "failed_at"} instead; see `failed` and `retry_due`.
+    """
+
+    def __init__(self, llm, on_built: Optional[Callable[[str, dict], Awaitable[None]]] = None):
+        self.llm = llm
+        self.on_built = on_built
+        self.chains = build_chains(llm)
+        self._building: Dict[str, asyncio.Task] = {}
+
+    def is_building(self, text_path: str) -> bool:
+        return text_path in self._building
+
+    def schedule(self, text_path: str) -> Optional[asyncio.Task]:
+        task = self._building.get(text_path)
+        if task is None:
+            task = asyncio.create_task(self._build(text_path))
+            self._building[text_path] = task
+            task.add_done_callback(lambda _: self._building.pop(text_path, None))
+        return task
+
+    async def _build(self, text_path: str):
+        loop = asyncio.get_running_loop()
+        try:
+            chunks = await loop.run_in_executor(None, read_chunks, text_path)
+            if not chunks:
+                raise ValueError("No text to summarize")
+            summary = await build_summary(self.llm, chunks, chains=self.chains)
+            await loop.run_in_executor(None, save_summary, text_path, summary)
+        except Exception as e:
+            print(f"Summary build failed for {text_path}: {e}")
+            try:
+                await loop.run_in_executor(None, save_summary, text_path,
+                                           {"status": "failed", "error": str(e), "failed_at": time.time()})
+            except OSError as e:
+                print(f"Could not record summary failure for {text_path}: {e}")
+            return
+        if self.on_built is not None:
+            await self.on_built(text_path, summary)
@@ -0,0 +1,42 @@
+# The backend runs against the fake providers and the local stores, in a scratch directory
+import os
+import sys
+import time
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+# Read by the modules at import time
+os.environ.update(LLM_PROVIDER="fake", EMBEDDING_PROVIDER="fake", OCR_PROVIDER="fake", TTS_PROVIDER="none",
+                  VECTOR_BACKEND="local", TOKEN_ENCODING="none", EMBEDDING_DIMENSION="256")
+
+
+def sample_pdf(name: str) -> str:
+    return os.path.join(BACKEND_DIR, name)
+
+
+@pytest.fixture(scope="session")
+def client(tmp_path_factory):
+    # The stores live in the working directory
+    os.chdir(tmp_path_factory.mktemp("backend"))
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def upload(client):
+    def upload(path: str, filename: str, directory: str = "") -> dict:
+        # Upload `path` as `filename` and wait for its ingest job
+        with open(path, "rb") as f:
+            job = client.post("/upload", files={"file": (filename, f, "application/pdf")},
+                              params={"directory": directory}).json()
+        deadline = time.monotonic() + 60
+        while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+            time.sleep(0.1)
+            job = client.get(f"/jobs/{job['id']}").json()
+        assert job["status"] == "done", job["error"]
+        return job
+    return upload
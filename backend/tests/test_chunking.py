@@ -0,0 +1,26 @@
+import random
+
+from chunking import SENTENCE_END, pack_chunks
+from tokens import token_counts
+
+
+def test_chunks_never_exceed_max_tokens():
+    rng = random.Random(0)
+    max_tokens, overlap_tokens = 40, 15
+    # Sentences of 2 to 38 tokens, so a carried overlap plus the next sentence often
+    # would not fit
+    pages = [(page, " ".join(("word " * rng.randint(1, 30)).strip() + "." for _ in range(20)))
+             for page in range(10)]
+
+    chunks = pack_chunks(pages, max_tokens, overlap_tokens)
+
+    assert len(chunks) > 1
+    for text, _, _ in chunks:
+        assert sum(token_counts(SENTENCE_END.split(text))) <= max_tokens
+
+
+def test_chunks_repeat_the_tail_of_the_previous_chunk():
+    pages = [(0, " ".join(f"Sentence number {n} is here." for n in range(30)))]
+    chunks = pack_chunks(pages, max_tokens=30, overlap_tokens=10)
+    for (previous, _, _), (text, _, _) in zip(chunks, chunks[1:]):
+        assert SENTENCE_END.split(previous)[-1] == SENTENCE_END.split(text)[0]
@@ -0,0 +1,25 @@
+import lexical_index
+from benchmarks.synthetic_pdfs import synthetic_pdf
+
+
+def test_backfill_matches_ingested_chunks(client, upload, tmp_path, monkeypatch):
+    import main
+    path = tmp_path / "backfill.pdf"
+    # Every third page is image-only and goes through OCR
+    path.write_bytes(synthetic_pdf(document=7, num_pages=12, image_every=3))
+    sha256 = upload(str(path), "backfill.pdf", "backfill")["sha256"]
+
+    main.lexical_index.refresh()
+    ingested = {id_: (text, metadata) for id_, text, metadata in zip(
+        main.lexical_index._ids, main.lexical_index._texts, main.lexical_index._metadatas)
+        if metadata["sha256"] == sha256}
+    assert ingested
+
+    # Rebuild from the manifest's extracted texts rather than the local vector store
+    monkeypatch.setattr(lexical_index, "LOCAL_INDEX_DIR", str(tmp_path / "no-local-index"))
+    rebuilt = lexical_index.LexicalIndex(str(tmp_path / "lexical"))
+    assert lexical_index.backfill(rebuilt)
+    backfilled = {id_: (text, metadata) for id_, text, metadata in zip(
+        rebuilt._ids, rebuilt._texts, rebuilt._metadatas) if metadata["sha256"] == sha256}
+
+    assert backfilled == ingested
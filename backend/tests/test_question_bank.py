@@ -0,0 +1,31 @@
+import asyncio
+import json
+
+from question_bank import QuestionBank, bank_path
+
+
+def test_sessions_see_no_repeats_across_workers(tmp_path):
+    text_path = str(tmp_path / "doc.txt")
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write("Some text.")
+    questions = [{"id": f"q{n}", "question": f"Question {n}?", "choices": ["a", "b"], "correct_answer": "a"}
+                 for n in range(6)]
+    with open(bank_path(text_path), "w", encoding="utf-8") as f:
+        json.dump({"questions": questions, "next_chunk": 0, "passes": 1}, f)
+
+    async def generate(context, num_questions):
+        return []
+
+    async def draw_alternately():
+        # Two worker processes' banks over the same files and served table
+        served_path = str(tmp_path / "served.sqlite3")
+        workers = [QuestionBank(generate, served_path), QuestionBank(generate, served_path)]
+        drawn = []
+        for turn in range(3):
+            drawn += await workers[turn % 2].draw([text_path], "session", 2)
+        drawn_by_other_session = await workers[0].draw([text_path], "other", 6)
+        return drawn, drawn_by_other_session
+
+    drawn, other = asyncio.run(draw_alternately())
+    assert sorted(q["id"] for q in drawn) == [q["id"] for q in questions]
+    assert len(other) == 6
@@ -0,0 +1,44 @@
+from conftest import sample_pdf
+
+
+def scoped_hashes(directory, filename):
+    # Content hashes of every chunk the scope reaches, in both local stores
+    import main
+    embedding = main.embeddings.embed_query("matrix sociology")
+    hashes = set()
+    for f in main.scope_filters(directory, filename):
+        hits = main.vector_store.similarity_search_with_score_by_vector(embedding, k=1000, filter=f)
+        hashes.update(doc.metadata["sha256"] for doc, _ in hits)
+        hits, _ = main.lexical_index.search("matrix sociology", k=1000, filter=f)
+        hashes.update(doc.metadata["sha256"] for doc, _ in hits)
+    return hashes
+
+
+def test_reupload_with_changed_bytes_replaces_old_content(client, upload):
+    import main
+    manifest = main.ingest_manifest
+    first = upload(sample_pdf("SJSUIntroSocTischlerChap1PPT.pdf"), "notes.pdf", "reupload")
+    second = upload(sample_pdf("linear-algebra primer.pdf"), "notes.pdf", "reupload")
+    assert first["sha256"] != second["sha256"]
+
+    assert manifest.hashes_for("reupload", "notes.pdf") == [second["sha256"]]
+    assert manifest.text_file_for("reupload", "notes.pdf") == second["result"]["text_file"]
+    assert manifest.text_files_for("reupload") == [second["result"]["text_file"]]
+    assert scoped_hashes("reupload", "notes.pdf") == {second["sha256"]}
+    # The replaced version is out of unscoped searches too
+    assert first["sha256"] not in scoped_hashes(None, None)
+
+    # Uploading the first version again makes it current again
+    again = upload(sample_pdf("SJSUIntroSocTischlerChap1PPT.pdf"), "notes.pdf", "reupload")
+    assert again["sha256"] == first["sha256"]
+    assert manifest.hashes_for("reupload", "notes.pdf") == [first["sha256"]]
+    assert scoped_hashes("reupload", "notes.pdf") == {first["sha256"]}
+
+
+def test_same_content_under_another_name_keeps_both(client, upload):
+    import main
+    first = upload(sample_pdf("linear-algebra primer.pdf"), "primer.pdf", "aliases")
+    copy = upload(sample_pdf("linear-algebra primer.pdf"), "primer-copy.pdf", "aliases")
+    assert copy["sha256"] == first["sha256"]
+    assert scoped_hashes("aliases", "primer-copy.pdf") == {first["sha256"]}
+    assert main.ingest_manifest.hashes_for("aliases", "primer.pdf") == [first["sha256"]]
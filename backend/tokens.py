@@ -0,0 +1,46 @@
+# Token counting with tiktoken, falling back to a character estimate when it is unavailable
+import os
+import threading
+from typing import List
+
+# "none" skips tiktoken (it downloads its encoding files on first use)
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+# Average characters per token of English text for the fallback estimate
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                if TOKEN_ENCODING != "none":
+                    try:
+                        import tiktoken
+                        _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                    except Exception as e:
+                        print(f"tiktoken unavailable, estimating token counts: {e.__class__.__name__}")
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def token_counts(texts: List[str]) -> List[int]:
+    encoding = get_encoding()
+    if encoding is None:
+        return [(len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN for text in texts]
+    return [len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=())]
+
+
+def count_tokens_many(texts: List[str]) -> int:
+    return sum(token_counts(texts))
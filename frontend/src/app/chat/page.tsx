@@ -44,30 +44,59 @@ export default function Chat() {
       setMessages((prev) => [...prev, userMessage]);
       setNewMessage("");
 
-      // Simulate API call for response
+      // Stream the answer so the first words show up (and can be read aloud) right away
       setIsLoading(true);
-      fetch(`http://localhost:8000/query?query=${encodeURIComponent(messageContent)}`, {
+      const botId = messages.length + 2;
+      const appendToBot = (text: string) =>
+        setMessages((prev) => {
+          const existing = prev.find((message) => message.id === botId);
+          if (existing) {
+            return prev.map((message) =>
+              message.id === botId ? { ...message, content: message.content + text } : message
+            );
+          }
+          return [...prev, { id: botId, content: text, sender: "bot" }];
+        });
+
+      fetch(`http://localhost:8000/query/stream?query=${encodeURIComponent(messageContent)}`, {
         method: "POST",
         headers: {
-          "Content-Type": "application/json",
+          Accept: "text/event-stream",
         },
       })
-        .then((response) => response.json())
-        .then((data) => {
-          const botResponse = {
-            id: messages.length + 2,
-            content: data.answer || "I'm processing your request. Please give me a moment.",
-            sender: "bot",
-          };
-          setMessages((prev) => [...prev, botResponse]);
+        .then(async (response) => {
+          if (!response.ok || !response.body) {
+            throw new Error(`Request failed with status ${response.status}`);
+          }
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = "";
+          for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split("\n\n");
+            buffer = events.pop() || "";
+            for (const rawEvent of events) {
+              const event = rawEvent.match(/^event: (.*)$/m)?.[1];
+              const data = rawEvent.match(/^data: (.*)$/m)?.[1];
+              if (!event || !data) continue;
+              if (event === "token") {
+                setIsLoading(false);
+                appendToBot(JSON.parse(data).text);
+              } else if (event === "error") {
+                throw new Error(JSON.parse(data).detail);
+              }
+            }
+          }
           setIsLoading(false);
         })
         .catch((error) => {
           console.error("Error:", error);
           setMessages((prev) => [
-            ...prev,
+            ...prev.filter((message) => message.id !== botId),
             {
-              id: messages.length + 2,
+              id: botId,
               content: "Sorry, there was an error processing your question.",
               sender: "bot",
             },
@@ -9,6 +9,7 @@ import { motion } from "framer-motion";
 import { Card, CardContent } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import StarryBackground from "./StarryBackground";
+import { getQuizSessionId } from "@/lib/quiz-session";
 
 interface Game {
   id: string;
@@ -59,7 +60,7 @@ export default function ArcadeQuizPage() {
   const fetchQuestions = async () => {
     setLoading(true);
     try {
-      const response = await fetch("http://localhost:8000/mcq?num_questions=10", {
+      const response = await fetch(`http://localhost:8000/mcq?num_questions=10&session_id=${getQuizSessionId()}`, {
         method: "POST",
       });
       if (!response.ok) {
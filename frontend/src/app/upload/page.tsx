@@ -8,9 +8,13 @@ import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card"
 import { ScrollArea } from "@/components/ui/scroll-area"
 import { Upload, FileText, ChevronDown, ChevronUp, Copy, Download, File as FileIcon } from "lucide-react"
 
+// Polls of /summary, two seconds apart, before giving up on the background build
+const SUMMARY_POLL_LIMIT = 150
+
 export default function EnhancedUploadPage() {
   const [file, setFile] = useState<File | null>(null)
   const [isUploading, setIsUploading] = useState(false)
+  const [progress, setProgress] = useState<string | null>(null)
   const [summary, setSummary] = useState<string | null>(null)
   const [isExpanded, setIsExpanded] = useState(false)
   const [uploadedFile, setUploadedFile] = useState<File | null>(null)
@@ -37,12 +41,34 @@ export default function EnhancedUploadPage() {
         if (uploadResponse.ok) {
           console.log("Upload successful")
           setUploadedFile(file)
-          const summaryResponse = await fetch("http://localhost:8000/summary")
-          if (summaryResponse.ok) {
+          // The PDF is processed by a background job; poll it until it finishes
+          let job = await uploadResponse.json()
+          const jobUrl = `http://localhost:8000/jobs/${job.job_id}`
+          while (job.status === "queued" || job.status === "running") {
+            setProgress(job.pages_total ? `${job.stage}: page ${job.pages_done} of ${job.pages_total}` : job.stage)
+            await new Promise((resolve) => setTimeout(resolve, 1000))
+            job = await (await fetch(jobUrl)).json()
+          }
+          if (job.status === "failed") {
+            throw new Error(job.error)
+          }
+          setProgress("summarizing")
+          // The summary is built in the background after ingest; poll until it is stored,
+          // its build fails, or SUMMARY_POLL_LIMIT polls have gone by
+          const summaryUrl = `http://localhost:8000/summary?filename=${encodeURIComponent(file.name)}`
+          let summaryResponse = await fetch(summaryUrl)
+          for (let polls = 0; summaryResponse.status === 202 && polls < SUMMARY_POLL_LIMIT; polls++) {
+            await new Promise((resolve) => setTimeout(resolve, 2000))
+            summaryResponse = await fetch(summaryUrl)
+          }
+          if (summaryResponse.status === 200) {
             const summaryData = await summaryResponse.json()
             setSummary(summaryData.summary)
+          } else if (summaryResponse.status === 202) {
+            console.error("Summary is taking too long; try again later")
           } else {
-            console.error("Failed to fetch summary")
+            const summaryData = await summaryResponse.json().catch(() => ({}))
+            console.error("Failed to fetch summary:", summaryData.error ?? summaryResponse.status)
           }
         } else {
           console.error("Upload failed")
@@ -56,6 +82,7 @@ export default function EnhancedUploadPage() {
         console.error("Upload or summary error:", error)
       }
 
+      setProgress(null)
       setIsUploading(false)
     }
   }
@@ -110,6 +137,9 @@ export default function EnhancedUploadPage() {
                 {isUploading ? "Uploading..." : "Upload"}
               </Button>
             </div>
+            {progress && (
+              <p className="text-sm text-gray-600">Processing ({progress})...</p>
+            )}
             {file && (
               <p className="text-sm text-gray-600">
                 <FileText className="inline mr-1 h-4 w-4" />
@@ -179,6 +209,15 @@ export default function EnhancedUploadPage() {
                     </Button>
                   </div>
                 </div>
+                {uploadedFile && (
+                  // Narrated in the background after ingest; served from the audio cache
+                  <audio
+                    controls
+                    preload="none"
+                    className="w-full mt-4"
+                    src={`http://localhost:8000/summary/audio?filename=${encodeURIComponent(uploadedFile.name)}`}
+                  />
+                )}
               </div>
             </motion.div>
           )}
@@ -5,6 +5,7 @@ import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { RadioGroup, RadioGroupItem } from "@/components/ui/radio-group";
 import { Label } from "@/components/ui/label";
+import { getQuizSessionId } from "@/lib/quiz-session";
 
 export function QuizComponent({ onClose }: { onClose: () => void }) {
     const [questions, setQuestions] = useState([]);
@@ -21,7 +22,7 @@ export function QuizComponent({ onClose }: { onClose: () => void }) {
     const fetchQuestions = async () => {
         setLoading(true);
         try {
-            const response = await fetch("http://localhost:8000/mcq?num_questions=10", {
+            const response = await fetch(`http://localhost:8000/mcq?num_questions=10&session_id=${getQuizSessionId()}`, {
                 method: "POST",
             });
             const data = await response.json();
@@ -0,0 +1,10 @@
+// Per-tab quiz session, so the backend question bank does not repeat questions within a session
+export function getQuizSessionId(): string {
+  const key = "quiz-session-id"
+  let sessionId = sessionStorage.getItem(key)
+  if (!sessionId) {
+    sessionId = crypto.randomUUID()
+    sessionStorage.setItem(key, sessionId)
+  }
+  return sessionId
+}
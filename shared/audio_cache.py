@@ -0,0 +1,153 @@
+# Synthesized speech on disk, shared by the backend and the voice service
+#
+# Files are content-addressed: <sha256(voice, format, text)>.<format> under TTS_CACHE_DIR, so
+# the same sentence in the same voice is synthesized once and then played from disk. The least
+# recently played files are deleted once the directory grows past TTS_CACHE_MAX_MB. Writes are
+# atomic, so processes can share one directory (each keeps its own view of the LRU order).
+import hashlib
+import os
+import struct
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "512"))
+MEDIA_TYPES = {"wav": "audio/wav", "mp3": "audio/mpeg"}
+
+
+def wav_bytes(pcm: bytes, sample_rate: int = 16000) -> bytes:
+    # 16-bit mono WAV container around raw PCM
+    header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + len(pcm), b"WAVE", b"fmt ", 16, 1, 1,
+                         sample_rate, sample_rate * 2, 2, 16, b"data", len(pcm))
+    return header + pcm
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def audio_key(text: str, voice: str, fmt: str) -> str:
+    return hashlib.sha256(f"{voice}\0{fmt}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Audio by (text, voice, format) with size-bounded LRU eviction.
+
+    `voice` names the engine and voice (e.g. "azure:en-US-JennyNeural"), `fmt` is a key of
+    MEDIA_TYPES and the file extension.
+    """
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = int(TTS_CACHE_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        # File name -> size, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._synthesizing: Dict[str, threading.Event] = {}
+        os.makedirs(directory, exist_ok=True)
+        # Playing a file touches its mtime, so the LRU order survives restarts
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.directory, f"{key}.{fmt}")
+
+    def read(self, key: str, fmt: str) -> Optional[bytes]:
+        name = f"{key}.{fmt}"
+        try:
+            with open(self.path(key, fmt), "rb") as f:
+                audio = f.read()
+            os.utime(self.path(key, fmt))
+        except FileNotFoundError:
+            # Never written, or evicted by another process
+            with self._lock:
+                self._size -= self._entries.pop(name, 0)
+            return None
+        with self._lock:
+            if name not in self._entries:
+                # Written by another process
+                self._entries[name] = len(audio)
+                self._size += len(audio)
+            self._entries.move_to_end(name)
+            self.stats["hits"] += 1
+        return audio
+
+    def get(self, text: str, voice: str, fmt: str) -> Optional[bytes]:
+        return self.read(audio_key(text, voice, fmt), fmt)
+
+    def put(self, text: str, voice: str, fmt: str, audio: bytes) -> str:
+        key = audio_key(text, voice, fmt)
+        self._write(key, fmt, audio)
+        return key
+
+    def _write(self, key: str, fmt: str, audio: bytes):
+        name = f"{key}.{fmt}"
+        tmp_path = os.path.join(self.directory, f"{name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, self.path(key, fmt))
+        with self._lock:
+            self._size += len(audio) - self._entries.pop(name, 0)
+            self._entries[name] = len(audio)
+            evicted = []
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old, size = self._entries.popitem(last=False)
+                self._size -= size
+                evicted.append(old)
+            self.stats["evictions"] += len(evicted)
+        for old in evicted:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except FileNotFoundError:
+                pass
+
+    def get_or_synthesize(self, text: str, voice: str, fmt: str,
+                          synthesize: Callable[[str], Optional[bytes]]) -> Optional[bytes]:
+        """Cached audio for `text`, calling `synthesize(text)` only on a miss.
+
+        Concurrent misses for the same audio in this process share one synthesis call.
+        """
+        key = audio_key(text, voice, fmt)
+        audio = self.read(key, fmt)
+        if audio is not None:
+            return audio
+        with self._lock:
+            event = self._synthesizing.get(key)
+            leader = event is None
+            if leader:
+                event = self._synthesizing[key] = threading.Event()
+        if not leader:
+            event.wait()
+            audio = self.read(key, fmt)
+            if audio is not None:
+                return audio
+            # The other synthesis failed; try once more on our own
+        try:
+            with self._lock:
+                self.stats["misses"] += 1
+            audio = synthesize(text)
+            if audio:
+                self._write(key, fmt, audio)
+            return audio
+        finally:
+            if leader:
+                with self._lock:
+                    self._synthesizing.pop(key, None)
+                event.set()
@@ -0,0 +1,282 @@
+# Pooled HTTP client for the LLM, embedding and speech APIs, shared by the backend and the voice service
+#
+# Keep-alive connection pools (no TLS handshake per call), connect/read timeouts, retries with
+# full-jitter backoff on 429/5xx and connection errors (honouring Retry-After), a cap on requests
+# in flight, and coalescing of identical requests that are in flight at the same time.
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+# Requests sent at once per process (sync and async callers are capped separately)
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20.0
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    # Full jitter, so clients that failed together do not all retry at the same moment
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX, float(retry_after)) + random.uniform(0, BACKOFF_BASE)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def request_key(url: str, payload: dict, headers: Dict[str, str]) -> str:
+    return hashlib.sha256(json.dumps([url, payload, sorted(headers.items())], sort_keys=True).encode()).hexdigest()
+
+
+class _LeaderGone(Exception):
+    """The caller sending a coalesced request was interrupted before it finished."""
+
+
+class _SharedRequest:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class LLMClient:
+    """POSTs JSON to an LLM API. `post_json`/`stream_lines` block, `apost_json`/`astream_lines`
+    are for event loops; each side keeps its own connection pool."""
+
+    def __init__(self, pool_size: int = LLM_POOL_SIZE, max_in_flight: int = LLM_MAX_IN_FLIGHT,
+                 connect_timeout: float = LLM_CONNECT_TIMEOUT, read_timeout: float = LLM_READ_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES):
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.stats = {"requests": 0, "retries": 0, "coalesced": 0}
+        self._lock = threading.Lock()
+        self._client = None
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pending: Dict[str, Future] = {}
+        # Async state belongs to one event loop and is rebuilt if another loop uses the client
+        self._async_loop = None
+        self._async_client = None
+        self._async_slots = None
+        self._async_pending: Dict[str, _SharedRequest] = {}
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(limits=self.limits, timeout=self.timeout)
+        return self._client
+
+    def _async_state(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._async_loop:
+            self._async_loop = loop
+            self._async_client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+            self._async_slots = asyncio.Semaphore(self.max_in_flight)
+            self._async_pending = {}
+        return self._async_client, self._async_slots, self._async_pending
+
+    def _retry(self, attempt: int, error: Optional[Exception] = None, response: Optional[httpx.Response] = None):
+        # Returns the backoff delay, or raises when the request should not be retried
+        if attempt >= self.max_retries:
+            if error is not None:
+                raise error
+            response.raise_for_status()
+        self.stats["retries"] += 1
+        return backoff_delay(attempt, response.headers.get("retry-after") if response is not None else None)
+
+    # Blocking callers
+
+    def post_json(self, url: str, payload: dict, headers: Optional[Dict[str, str]] = None,
+                  coalesce: bool = True) -> dict:
+        headers = headers or {}
+        if not coalesce:
+            return self._post_json(url, payload, headers)
+        key = request_key(url, payload, headers)
+        while True:
+            with self._lock:
+                future = self._pending.get(key)
+                leader = future is None
+                if leader:
+                    future = self._pending[key] = Future()
+            if leader:
+                break
+            # An identical request is already in flight: share its response
+            self.stats["coalesced"] += 1
+            try:
+                return copy.deepcopy(future.result())
+            except _LeaderGone:
+                # Its caller was interrupted; send the request ourselves
+                continue
+        try:
+            result = self._post_json(url, payload, headers)
+        except Exception as e:
+            self._settle(key, future, exception=e)
+            raise
+        except BaseException:
+            # Interrupted, not failed: waiting callers must not inherit the interruption
+            self._settle(key, future, exception=_LeaderGone())
+            raise
+        self._settle(key, future, result=result)
+        return result
+
+    def _settle(self, key: str, future: Future, result=None, exception: Optional[BaseException] = None):
+        # Unregistered first, so a caller retrying after _LeaderGone starts a new request
+        with self._lock:
+            self._pending.pop(key, None)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def _post_json(self, url: str, payload: dict, headers: Dict[str, str]) -> dict:
+        return self._post(url, headers, json=payload).json()
+
+    def post_bytes(self, url: str, content: bytes, headers: Optional[Dict[str, str]] = None) -> bytes:
+        # Raw request and response bodies (e.g. SSML in, audio out); not coalesced
+        return self._post(url, headers or {}, content=content).content
+
+    def _post(self, url: str, headers: Dict[str, str], **body) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            # A slot is only held while the request is on the wire, not during backoff
+            with self._slots:
+                self.stats["requests"] += 1
+                try:
+                    response = self.client.post(url, headers=headers, **body)
+                except httpx.TransportError as e:
+                    delay = self._retry(attempt, error=e)
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return response
+                    delay = self._retry(attempt, response=response)
+            time.sleep(delay)
+
+    def stream_lines(self, url: str, payload: dict, headers: Optional[Dict[str, str]] = None) -> Iterator[str]:
+        # Lines of a streamed response; retried only until the first line has arrived
+        started = False
+        for attempt in range(self.max_retries + 1):
+            with self._slots:
+                self.stats["requests"] += 1
+                try:
+                    with self.client.stream("POST", url, json=payload, headers=headers or {}) as response:
+                        if response.status_code in RETRY_STATUSES:
+                            response.read()
+                            delay = self._retry(attempt, response=response)
+                        else:
+                            response.raise_for_status()
+                            for line in response.iter_lines():
+                                started = True
+                                yield line
+                            return
+                except httpx.TransportError as e:
+                    if started:
+                        raise
+                    delay = self._retry(attempt, error=e)
+            time.sleep(delay)
+
+    # Event-loop callers
+
+    async def apost_json(self, url: str, payload: dict, headers: Optional[Dict[str, str]] = None,
+                         coalesce: bool = True) -> dict:
+        headers = headers or {}
+        if not coalesce:
+            return await self._apost_json(url, payload, headers)
+        _, _, pending = self._async_state()
+        key = request_key(url, payload, headers)
+        shared = pending.get(key)
+        if shared is None:
+            # The request runs as its own task, so cancelling one caller does not cancel it
+            # for the others; only the last caller to give up cancels it
+            shared = pending[key] = _SharedRequest(asyncio.ensure_future(self._apost_json(url, payload, headers)))
+            shared.task.add_done_callback(lambda _: pending.pop(key, None) if pending.get(key) is shared else None)
+        else:
+            self.stats["coalesced"] += 1
+        shared.waiters += 1
+        try:
+            return copy.deepcopy(await asyncio.shield(shared.task))
+        except asyncio.CancelledError:
+            if shared.waiters == 1 and not shared.task.done():
+                shared.task.cancel()
+            raise
+        finally:
+            shared.waiters -= 1
+
+    async def _apost_json(self, url: str, payload: dict, headers: Dict[str, str]) -> dict:
+        client, slots, _ = self._async_state()
+        for attempt in range(self.max_retries + 1):
+            async with slots:
+                self.stats["requests"] += 1
+                try:
+                    response = await client.post(url, json=payload, headers=headers)
+                except httpx.TransportError as e:
+                    delay = self._retry(attempt, error=e)
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return response.json()
+                    delay = self._retry(attempt, response=response)
+            await asyncio.sleep(delay)
+
+    async def astream_lines(self, url: str, payload: dict,
+                            headers: Optional[Dict[str, str]] = None) -> AsyncIterator[str]:
+        client, slots, _ = self._async_state()
+        started = False
+        for attempt in range(self.max_retries + 1):
+            async with slots:
+                self.stats["requests"] += 1
+                try:
+                    async with client.stream("POST", url, json=payload, headers=headers or {}) as response:
+                        if response.status_code in RETRY_STATUSES:
+                            await response.aread()
+                            delay = self._retry(attempt, response=response)
+                        else:
+                            response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                started = True
+                                yield line
+                            return
+                except httpx.TransportError as e:
+                    if started:
+                        raise
+                    delay = self._retry(attempt, error=e)
+            await asyncio.sleep(delay)
+
+
+def sse_data(lines) -> Iterator[dict]:
+    # JSON payloads of an OpenAI-style server-sent event stream
+    for line in lines:
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        yield json.loads(data)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    # One pool per process, shared by every caller
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client